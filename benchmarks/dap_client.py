@@ -0,0 +1,144 @@
+"""
+A minimal DAP client that drives the adapter the way an IDE does.
+"""
+
+import collections
+import json
+import socket
+import threading
+import time
+
+
+class DAPError(Exception):
+    """A request that the adapter answered with `success` false."""
+
+
+class DAPClient:
+    """
+    Connects to a running adapter and exchanges DAP messages with it.
+
+    Messages are read in a background thread, and stamped with `time.perf_counter` on
+    arrival, so latencies measured with the client do not include the time the caller
+    takes to pick them up.
+
+    Parameters
+    ----------
+    host, port : str, int
+        Where the adapter listens.
+    timeout : float
+        Seconds to wait for the adapter to listen, and for responses and events.
+    """
+
+    def __init__(self, host="localhost", port=9000, timeout=10):
+        self.timeout = timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._sock = socket.create_connection((host, port))
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._seq = 0
+        self._responses = {}
+        self._events = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_loop, name="dap-client", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        buffer = b""
+        try:
+            while True:
+                while b"\r\n\r\n" not in buffer:
+                    chunk = self._sock.recv(65536)
+                    if not chunk:
+                        return
+                    buffer += chunk
+                header, buffer = buffer.split(b"\r\n\r\n", 1)
+                length = int(header.split(b":")[1])
+                while len(buffer) < length:
+                    chunk = self._sock.recv(65536)
+                    if not chunk:
+                        return
+                    buffer += chunk
+                message, buffer = json.loads(buffer[:length]), buffer[length:]
+                arrived = time.perf_counter()
+                with self._condition:
+                    if message.get("type") == "response":
+                        self._responses[message["request_seq"]] = (message, arrived)
+                    else:
+                        self._events.append((message, arrived))
+                    self._condition.notify_all()
+        except OSError:
+            pass
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+
+    def send(self, command, **arguments):
+        """Send a request without waiting, and return its sequence number."""
+        self._seq += 1
+        body = json.dumps(
+            {"type": "request", "seq": self._seq, "command": command, "arguments": arguments}
+        ).encode()
+        self._sock.sendall(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        return self._seq
+
+    def response(self, seq):
+        """Wait for the response to request `seq`, as `(message, arrival time)`."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: seq in self._responses or self._closed, self.timeout
+            ):
+                raise TimeoutError(f"No response to request {seq}")
+            if seq not in self._responses:
+                raise ConnectionError("The adapter closed the connection")
+            return self._responses.pop(seq)
+
+    def request(self, command, **arguments):
+        """Send a request and return the body of its response."""
+        message, _ = self.response(self.send(command, **arguments))
+        if not message.get("success", False):
+            raise DAPError(f"{command}: {message.get('message')}")
+        return message.get("body", {})
+
+    def wait_event(self, name, timeout=None):
+        """Wait for the next event called `name`, as `(message, arrival time)`."""
+        with self._condition:
+            found = self._condition.wait_for(
+                lambda: self._closed or any(e["event"] == name for e, _ in self._events),
+                self.timeout if timeout is None else timeout,
+            )
+            for i, (event, arrived) in enumerate(self._events):
+                if event["event"] == name:
+                    del self._events[i]
+                    return event, arrived
+            if not found:
+                raise TimeoutError(f"No {name} event")
+            raise ConnectionError("The adapter closed the connection")
+
+    def drain_events(self, name=None):
+        """Remove and return the received events, only those called `name` if given."""
+        with self._condition:
+            drained = [(e, t) for e, t in self._events if name is None or e["event"] == name]
+            self._events = collections.deque(
+                (e, t) for e, t in self._events if name is not None and e["event"] != name
+            )
+            return drained
+
+    def close(self):
+        try:
+            self._sock.close()
+        finally:
+            self._reader.join(self.timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
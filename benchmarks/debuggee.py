@@ -0,0 +1,30 @@
+"""
+Scripted debuggee for :mod:`replay`.
+"""
+
+import ipdab
+
+
+def step(i):
+    squared = i * i
+    return squared % 7
+
+
+def compute(n):
+    total = 0
+    data = {"values": list(range(100)), "name": "replay"}
+    for i in range(n):
+        total += step(i)  # breakpoint
+    return total, data
+
+
+def main():
+    ipdab.set_trace(on_continue="keep_running")
+    results = []
+    for _ in range(1000):
+        results.append(compute(10))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Scripted debuggee for :mod:`replay`: each stop is 500 frames deep.
+"""
+
+import ipdab
+
+
+def descend(depth):
+    if depth == 0:
+        total = sum(range(10))  # breakpoint
+        return total
+    return descend(depth - 1) + 1
+
+
+def main():
+    ipdab.set_trace(on_continue="keep_running")
+    results = []
+    for _ in range(100):
+        results.append(descend(500))
+    return results
+
+
+if __name__ == "__main__":
+    main()
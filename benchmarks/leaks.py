@@ -0,0 +1,39 @@
+"""
+Check that the debugger does not keep objects alive once the program continues.
+
+Replays `sessions/leak.json`, which stops 20 times in a frame holding a large object and
+inspects each stop like an IDE does. At the end, the debuggee reports how many of these
+objects are still alive. Exits with status 1 if any is::
+
+    python benchmarks/leaks.py --backend pdb
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from replay import HERE, replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=["ipdb", "pdb"], default="ipdb")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    with open(os.path.join(HERE, "sessions", "leak.json")) as f:
+        session = json.load(f)
+    output = []
+    replay(session, backend=args.backend, port=args.port, output=output)
+    match = re.search(r"alive: (\d+) of (\d+)", output[0])
+    if match is None:
+        sys.exit("The debuggee did not report its objects")
+    alive, total = map(int, match.groups())
+    print(f"{alive} of {total} objects inspected at a stop are still alive")
+    if alive:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
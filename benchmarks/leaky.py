@@ -0,0 +1,33 @@
+"""
+Scripted debuggee for :mod:`leaks`: each stop is in a frame holding a large object.
+"""
+
+import gc
+import weakref
+
+import ipdab
+
+refs = []
+
+
+class Payload:
+    def __init__(self):
+        self.data = bytearray(10 * 2**20)
+
+
+def work():
+    payload = Payload()
+    refs.append(weakref.ref(payload))
+    return len(payload.data)  # breakpoint
+
+
+def main():
+    ipdab.set_trace(on_continue="keep_running")
+    for _ in range(20):
+        work()
+    gc.collect()
+    print(f"alive: {sum(ref() is not None for ref in refs)} of {len(refs)}")
+
+
+if __name__ == "__main__":
+    main()
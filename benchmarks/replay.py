@@ -0,0 +1,170 @@
+"""
+Replay a recorded debug session against a scripted debuggee, and report latencies.
+
+A session, see `sessions/`, names the debuggee, the requests to send once connected,
+and a list of stops. Each stop is a pdb command that lets the program run, typed into
+the stdin of the debuggee, after which the `burst` of requests an IDE sends on every stop is replayed. Strings in
+the requests are placeholders filled in from the session so far:
+
+- ``$debuggee``: the path of the debuggee.
+- ``$line:<marker>``: the line of the debuggee that ends with the comment ``# <marker>``.
+- ``$threadId``: the thread of the last stopped event.
+- ``$frameId``: the top frame of the last `stackTrace` response.
+- ``$locals``, ``$globals``: the scopes of the last `scopes` response.
+
+Reported are the p50 and p99 latency per request, the latency from typing a command
+to the stopped event, and the time of the whole burst::
+
+    python benchmarks/replay.py benchmarks/sessions/stepping.json --backend pdb
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from dap_client import DAPClient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def type_command(process, command):
+    """Type `command` at the prompt of the debuggee, standing in for its terminal."""
+    process.stdin.write(command + "\n")
+    process.stdin.flush()
+
+
+def find_line(path, marker):
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            if line.rstrip().endswith(f"# {marker}"):
+                return lineno
+    raise ValueError(f"No line marked {marker!r} in {path}")
+
+
+def fill(value, context):
+    """Substitute the placeholders in `value`, see the module docstring."""
+    if isinstance(value, dict):
+        return {k: fill(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [fill(v, context) for v in value]
+    if isinstance(value, str) and value.startswith("$"):
+        if value.startswith("$line:"):
+            return find_line(context["debuggee"], value[len("$line:") :])
+        return context[value[1:]]
+    return value
+
+
+def learn(command, body, context):
+    """Remember what later placeholders refer to from the response to `command`."""
+    if command == "stackTrace" and body.get("stackFrames"):
+        context["frameId"] = body["stackFrames"][0]["id"]
+    elif command == "scopes":
+        for scope in body.get("scopes", []):
+            context[scope["name"].lower()] = scope["variablesReference"]
+
+
+def replay(session, backend="ipdb", port=9000, output=None):
+    """
+    Run `session` and return the latencies in seconds, by name. If `output` is a list,
+    what the debuggee printed is appended to it.
+    """
+    debuggee = os.path.join(HERE, session["debuggee"])
+    context = {"debuggee": debuggee}
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(HERE), HERE]))
+    code = (
+        "import sys, runpy, ipdab.server as s;"
+        f"s.ipdab = s.IPDBAdapterServer(port={port}, debugger={backend!r});"
+        f"runpy.run_path({debuggee!r}, run_name='__main__')"
+    )
+    stdout = subprocess.DEVNULL if output is None else tempfile.TemporaryFile("w+")
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        stdin=subprocess.PIPE,
+        stdout=stdout,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        env=env,
+    )
+    latencies = {}
+    try:
+        with DAPClient(port=port) as client:
+            for command, arguments in [
+                ["initialize", {"adapterID": "replay", "supportsInvalidatedEvent": True}],
+                ["launch", {}],
+                *session.get("setup", []),
+                ["configurationDone", {}],
+            ]:
+                client.request(command, **fill(arguments, context))
+            event, _ = client.wait_event("stopped")
+            context["threadId"] = event["body"]["threadId"]
+            for stop in session["stops"]:
+                for _ in range(stop.get("repeat", 1)):
+                    typed = time.perf_counter()
+                    type_command(process, stop["command"])
+                    # Stopped events from before the program resumed are stale
+                    _, resumed = client.wait_event("continued")
+                    arrived = 0
+                    while arrived < resumed:
+                        event, arrived = client.wait_event("stopped")
+                    context["threadId"] = event["body"]["threadId"]
+                    latencies.setdefault("stop", []).append(arrived - typed)
+                    start = time.perf_counter()
+                    for command, arguments in session["burst"]:
+                        sent = time.perf_counter()
+                        message, arrived = client.response(
+                            client.send(command, **fill(arguments, context))
+                        )
+                        latencies.setdefault(command, []).append(arrived - sent)
+                        learn(command, message.get("body", {}), context)
+                    latencies.setdefault("burst", []).append(time.perf_counter() - start)
+            client.request("setBreakpoints", source={"path": debuggee}, breakpoints=[])
+        type_command(process, "c")
+        process.wait(30)
+    finally:
+        process.kill()
+        if output is not None:
+            stdout.seek(0)
+            output.append(stdout.read())
+            stdout.close()
+    return latencies
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def report(latencies):
+    print(f"{'':<14} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for name, values in latencies.items():
+        print(
+            f"{name:<14} {len(values):>6} {percentile(values, 50) * 1e3:>8.2f} "
+            f"{percentile(values, 99) * 1e3:>8.2f} {statistics.mean(values) * 1e3:>8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "session", nargs="?", default=os.path.join(HERE, "sessions", "stepping.json")
+    )
+    parser.add_argument("--backend", choices=["ipdb", "pdb"], default="ipdb")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--json", action="store_true", help="Print the raw latencies as JSON")
+    args = parser.parse_args()
+    with open(args.session) as f:
+        session = json.load(f)
+    latencies = replay(session, backend=args.backend, port=args.port)
+    if args.json:
+        print(json.dumps(latencies))
+    else:
+        report(latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Breakpoint target for :mod:`tracing`, in a module of its own, as the workloads would
+otherwise be traced line by line.
+"""
+
+
+def never_called():
+    # The benchmarks put a breakpoint here, so the debugger keeps tracing, but never stops
+    return None
@@ -0,0 +1,196 @@
+"""
+Benchmark the overhead of tracing with the debugger backends.
+
+Each workload of :mod:`workloads` runs in a fresh process per configuration: without a
+debugger, or after continuing from a `set_trace` of `CustomPdb` or `CustomTerminalPdb`,
+with or without a breakpoint, with skip and unskip lists of various sizes, and
+stepping into libraries. The breakpoint is in a module of its own and never hit, but
+makes `bdb` keep tracing, which is the case where the dispatch path and `SkipMatcher`
+matter.
+
+Results are reported as slowdown factors relative to running without a debugger, and
+can be compared against a stored baseline to catch regressions::
+
+    python benchmarks/tracing.py                 # report
+    python benchmarks/tracing.py --save          # store the results as the baseline
+    python benchmarks/tracing.py --check         # fail on regressions against the baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "baseline.json")
+
+#: Name -> (backend, breakpoint, number of skip patterns, skip libraries,
+#: number of unskip patterns)
+CONFIGS = {
+    "none": (None, False, 0, True, 0),
+    "pdb": ("pdb", False, 0, True, 0),
+    "ipdb": ("ipdb", False, 0, True, 0),
+    "pdb+bp": ("pdb", True, 0, True, 0),
+    "ipdb+bp": ("ipdb", True, 0, True, 0),
+    "pdb+bp+skip100": ("pdb", True, 100, True, 0),
+    "pdb+bp+skip1000": ("pdb", True, 1000, True, 0),
+    "pdb+bp+libs": ("pdb", True, 0, False, 0),
+    "pdb+bp+unskip10": ("pdb", True, 0, True, 10),
+    "pdb+bp+unskip100": ("pdb", True, 0, True, 100),
+    "pdb+bp+unskip1000": ("pdb", True, 0, True, 1000),
+}
+
+
+def skip_patterns(n, prefix="nonexistent"):
+    """`n` skip patterns that match nothing, half of them with wildcards."""
+    return [f"{prefix}{i}.*" if i % 2 else f"{prefix}{i}" for i in range(n)]
+
+
+def arm(backend, breakpoint, n_skip, skip_libraries, n_unskip):
+    """Start the debugger and continue from the prompt, as a user would."""
+    from ipdab.debugger import Debugger
+
+    import target
+
+    # Unskip patterns that match nothing, so every library module is checked against all
+    # of them, and still skipped, as with `pdb+bp`
+    debugger = Debugger(
+        backend=backend,
+        skip=skip_patterns(n_skip),
+        skip_libraries=skip_libraries,
+        unskip=skip_patterns(n_unskip, prefix="unskipped"),
+    )
+    if breakpoint:
+        debugger.set_break(target.__file__, target.never_called.__code__.co_firstlineno + 2)
+    # The prompt reads the "c" piped to stdin by `measure`
+    debugger.set_trace(sys._getframe().f_back)
+    return debugger
+
+
+def child(workload, config, repeat):
+    """Time `workload` under `config` in this process, and print the timings as JSON."""
+    sys.path.insert(0, HERE)
+    sys.path.insert(0, os.path.dirname(HERE))
+    import workloads
+
+    # Imported for every configuration, so all start with the same modules loaded
+    import ipdab.debugger  # noqa: F401
+
+    func = workloads.WORKLOADS[workload]
+    backend, *options = CONFIGS[config]
+    if backend is not None:
+        arm(backend, *options)
+    func()  # warm up, e.g., the skip cache and the regex cache
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    sys.settrace(None)
+    # On a line of its own, the prompt of the debugger does not end with a newline
+    print("\n" + json.dumps(timings))
+
+
+def measure(workload, config, repeat):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", workload, config, "--repeat", str(repeat)],
+        input="c\n",
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(workloads, configs, repeat):
+    """The slowdown factors as {workload: {config: factor}}, and the untraced times."""
+    results, untraced = {}, {}
+    for workload in workloads:
+        times = {config: min(measure(workload, config, repeat)) for config in ["none", *configs]}
+        untraced[workload] = times.pop("none")
+        results[workload] = {c: t / untraced[workload] for c, t in times.items()}
+    return results, untraced
+
+
+def report(results, untraced, baseline=None):
+    configs = list(next(iter(results.values())))
+    width = max(len(c) for c in configs)
+    if baseline is not None:
+        width = max(width, len("100.00x (100.00)"))
+    print(f"{'workload':<12} {'untraced':>9}  " + "  ".join(f"{c:>{width}}" for c in configs))
+    for workload, factors in results.items():
+        cells = []
+        for config in configs:
+            cell = f"{factors[config]:.2f}x"
+            if baseline is not None and config in baseline.get(workload, {}):
+                cell = f"{cell} ({baseline[workload][config]:.2f})"
+            cells.append(f"{cell:>{width}}")
+        print(f"{workload:<12} {untraced[workload] * 1e3:>7.1f}ms  " + "  ".join(cells))
+
+
+def regressions(results, baseline, tolerance):
+    """The `(workload, config, factor, baseline)` that got slower by more than `tolerance`."""
+    found = []
+    for workload, factors in results.items():
+        for config, factor in factors.items():
+            expected = baseline.get(workload, {}).get(config)
+            if expected is not None and factor > expected * (1 + tolerance):
+                found.append((workload, config, factor, expected))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--child", nargs=2, metavar=("WORKLOAD", "CONFIG"), help=argparse.SUPPRESS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workload", action="append", help="Only run these workloads")
+    parser.add_argument("--config", action="append", help="Only run these configurations")
+    parser.add_argument("--save", action="store_true", help="Store the results as baseline")
+    parser.add_argument("--check", action="store_true", help="Exit 1 on regressions")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.3, help="Allowed relative slowdown, default 0.3"
+    )
+    args = parser.parse_args()
+    if args.child:
+        return child(*args.child, args.repeat)
+
+    sys.path.insert(0, HERE)
+    from workloads import WORKLOADS
+
+    configs = [c for c in args.config or CONFIGS if c != "none"]
+    results, untraced = run(args.workload or list(WORKLOADS), configs, args.repeat)
+    baseline = None
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)["slowdown"]
+    report(results, untraced, baseline)
+    if args.save:
+        with open(BASELINE, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "slowdown": {
+                        w: {c: round(x, 2) for c, x in factors.items()}
+                        for w, factors in results.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+    if args.check and baseline is not None:
+        found = regressions(results, baseline, args.tolerance)
+        for workload, config, factor, expected in found:
+            print(
+                f"Regression: {workload} under {config}: {factor:.2f}x, baseline {expected:.2f}x"
+            )
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
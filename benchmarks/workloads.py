@@ -0,0 +1,82 @@
+"""
+Representative workloads for :mod:`tracing`. Each one takes some tens of milliseconds untraced.
+"""
+
+import asyncio
+import importlib
+import json
+import re
+import sys
+
+
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+def recursion():
+    fib(26)
+
+
+def _add(a, b):
+    return a + b
+
+
+def small_calls():
+    total = 0
+    for i in range(500_000):
+        total = _add(total, i)
+    return total
+
+
+async def _echo(i):
+    await asyncio.sleep(0)
+    return i
+
+
+async def _gather():
+    return await asyncio.gather(*(_echo(i) for i in range(1000)))
+
+
+def stdlib():
+    data = {"name": "ipdab", "values": list(range(100)), "nested": {"a": [1.5, None, True]}}
+    pattern = re.compile(r"(\w+)@(\w+)\.com")
+    for _ in range(2000):
+        json.loads(json.dumps(data))
+        pattern.findall("alice@example.com, bob@example.com, carol@example.com")
+    asyncio.run(_gather())
+
+
+#: Pure Python packages that neither the debugger nor IPython import, imported afresh
+#: on every run of `imports`
+PACKAGES = (
+    "configparser",
+    "email.mime.multipart",
+    "http.cookiejar",
+    "http.server",
+    "imaplib",
+    "mailbox",
+    "multiprocessing.pool",
+    "plistlib",
+    "smtplib",
+    "statistics",
+    "tarfile",
+    "unittest",
+    "wsgiref.simple_server",
+    "xmlrpc.server",
+)
+
+
+def imports():
+    before = set(sys.modules)
+    for name in PACKAGES:
+        importlib.import_module(name)
+    for name in set(sys.modules) - before:
+        del sys.modules[name]
+
+
+WORKLOADS = {
+    "recursion": recursion,
+    "small_calls": small_calls,
+    "stdlib": stdlib,
+    "imports": imports,
+}
@@ -1 +1,9 @@
+from .extension import load_ipython_extension as load_ipython_extension
+from .extension import unload_ipython_extension as unload_ipython_extension
+from .server import enable_metrics as enable_metrics
+from .server import install_excepthook as install_excepthook
+from .server import install_signal_handler as install_signal_handler
+from .server import pm as pm
+from .server import post_mortem as post_mortem
 from .server import set_trace as set_trace
+from .server import uninstall_excepthook as uninstall_excepthook
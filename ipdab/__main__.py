@@ -0,0 +1,54 @@
+"""
+Run a script or module under the debugger, with the breakpoints of the IDE armed::
+
+    python -m ipdab [--wait SECONDS] script.py [args ...]
+    python -m ipdab [--wait SECONDS] -m module [args ...]
+"""
+
+import argparse
+import os
+import sys
+
+from . import server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ipdab",
+        description="Run a Python program under ipdab, stopping at the breakpoints set by the IDE.",
+    )
+    parser.add_argument("--host", default="localhost", help="host to listen on")
+    parser.add_argument("--port", type=int, default=9000, help="port to listen on")
+    parser.add_argument(
+        "--debugger", choices=("ipdb", "pdb"), default="ipdb", help="debugger backend"
+    )
+    parser.add_argument(
+        "--wait",
+        type=float,
+        default=10,
+        metavar="SECONDS",
+        help=(
+            "wait up to SECONDS (default: %(default)s) for the IDE to set its breakpoints "
+            "before running, 'inf' for as long as it takes, 0 to run right away"
+        ),
+    )
+    parser.add_argument("-m", dest="module", action="store_true", help="run target as a module")
+    parser.add_argument("target", help="script path, or module name with -m")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments of the program")
+    args = parser.parse_args(argv)
+
+    if not args.module:
+        if not os.path.exists(args.target):
+            parser.error(f"No such file: {args.target}")
+        # Like `python script.py`, rather than `python -m ipdab`
+        sys.path[0] = os.path.dirname(os.path.abspath(args.target))
+    sys.argv = [args.target, *args.args]
+
+    if args.debugger != "ipdb" or args.host != "localhost" or args.port != 9000:
+        server.ipdab = server.IPDBAdapterServer(args.host, args.port, debugger=args.debugger)
+    wait = None if args.wait == float("inf") else args.wait
+    server.ipdab.run(args.target, module=args.module, wait=wait)
+
+
+if __name__ == "__main__":
+    main()
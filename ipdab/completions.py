@@ -0,0 +1,193 @@
+import bisect
+import builtins
+import inspect
+import keyword
+import re
+import time
+import types
+
+# The dotted name that ends at the cursor, e.g. "obj.attr.pre"
+_DOTTED = re.compile(r"[A-Za-z_][\w.]*$")
+
+# DAP `CompletionItemType`s of the types of completions of IPython
+_IPYTHON_TYPES = {
+    "function": "function",
+    "class": "class",
+    "module": "module",
+    "keyword": "keyword",
+    "magic": "keyword",
+    "path": "file",
+    "property": "property",
+    "instance": "variable",
+    "param": "variable",
+    "statement": "variable",
+}
+
+
+def _kind(value):
+    """The DAP `CompletionItemType` of `value`."""
+    if isinstance(value, types.ModuleType):
+        return "module"
+    if isinstance(value, type):
+        return "class"
+    if isinstance(value, (types.FunctionType, types.BuiltinFunctionType, types.MethodType)):
+        return "function"
+    if isinstance(
+        value,
+        (
+            staticmethod,
+            classmethod,
+            types.MethodDescriptorType,
+            types.WrapperDescriptorType,
+            types.MethodWrapperType,
+        ),
+    ):
+        return "method"
+    if isinstance(value, property) or inspect.isdatadescriptor(value):
+        return "property"
+    return "variable"
+
+
+class CompletionIndex:
+    """
+    Completions in the namespace of one frame, at one stop.
+
+    The names of the frame, i.e., its locals, globals and the builtins, are collected
+    and sorted once, and so are the members of each object completed on, so every
+    further keystroke costs a binary search for the prefix.
+
+    Attribute chains like ``obj.attr.`` are resolved with `inspect.getattr_static`, so no
+    property or `__getattr__` runs on the program's objects. Only the listing of the
+    members itself calls `dir`. The types of the members, which take a lookup each, are
+    only determined within a time budget; members past it are plain "variable"s.
+
+    Parameters
+    ----------
+    frame : frame
+        The frame to complete in.
+    attributes : bool
+        Complete attribute chains, not just names.
+    budget : float
+        Seconds to spend on finding out the types of the members of an object.
+    shell : InteractiveShell, optional
+        Complete with the completer of this IPython shell instead, in the namespace of
+        the frame. This is what the ipdb prompt completes with, but its completions are
+        not cached, and it does evaluate attributes.
+    """
+
+    def __init__(self, frame, attributes=True, budget=0.05, shell=None):
+        self.frame = frame
+        self.attributes = attributes
+        self.budget = budget
+        self.shell = shell
+        self._completer = None
+        self._names = None
+        # id -> (object, sorted members as (name, type)), the object keeps the id unique
+        self._members = {}
+
+    def names(self):
+        if self._names is None:
+            namespace = {name: "keyword" for name in keyword.kwlist}
+            namespace.update((name, _kind(v)) for name, v in vars(builtins).items())
+            namespace.update((name, _kind(v)) for name, v in self.frame.f_globals.items())
+            namespace.update((name, _kind(v)) for name, v in self.frame.f_locals.items())
+            self._names = sorted(namespace.items())
+        return self._names
+
+    def members(self, obj):
+        try:
+            return self._members[id(obj)][1]
+        except KeyError:
+            pass
+        try:
+            names = dir(obj)
+        except Exception:
+            names = []
+        deadline = time.perf_counter() + self.budget
+        members = []
+        for name in names:
+            kind = "variable"
+            if time.perf_counter() < deadline:
+                try:
+                    kind = _kind(inspect.getattr_static(obj, name))
+                except AttributeError:
+                    pass
+            members.append((name, kind))
+        members.sort()
+        self._members[id(obj)] = (obj, members)
+        return members
+
+    def resolve(self, dotted):
+        """The object `dotted` refers to, or raise `LookupError`."""
+        first, *rest = dotted.split(".")
+        for namespace in (self.frame.f_locals, self.frame.f_globals, vars(builtins)):
+            if first in namespace:
+                obj = namespace[first]
+                break
+        else:
+            raise LookupError(first)
+        for name in rest:
+            try:
+                attribute = inspect.getattr_static(obj, name)
+            except AttributeError:
+                raise LookupError(name)
+            if isinstance(attribute, (staticmethod, classmethod)):
+                attribute = attribute.__func__
+            elif inspect.isdatadescriptor(attribute) or inspect.ismethoddescriptor(attribute):
+                # Properties, slots, and the like, which only `getattr` can evaluate
+                raise LookupError(name)
+            obj = attribute
+        return obj
+
+    def complete(self, text, column):
+        """
+        The DAP `CompletionItem`s for the cursor at `column`, 0-based, in `text`.
+        """
+        if self.shell is not None:
+            return self._complete_ipython(text, column)
+        match = _DOTTED.search(text[:column])
+        if match is None:
+            return []
+        base, _, prefix = match.group().rpartition(".")
+        if base:
+            if not self.attributes:
+                return []
+            try:
+                candidates = self.members(self.resolve(base))
+            except LookupError:
+                return []
+        else:
+            candidates = self.names()
+        if not prefix.startswith("_"):
+            candidates = [c for c in candidates if not c[0].startswith("_")]
+        start = bisect.bisect_left(candidates, (prefix,))
+        items = []
+        for name, kind in candidates[start:]:
+            if not name.startswith(prefix):
+                break
+            items.append(
+                {"label": name, "type": kind, "start": column - len(prefix), "length": len(prefix)}
+            )
+        return items
+
+    def _complete_ipython(self, text, column):
+        from IPython.core.completer import IPCompleter, provisionalcompleter
+
+        if self._completer is None:
+            self._completer = IPCompleter(
+                shell=self.shell,
+                namespace=self.frame.f_locals,
+                global_namespace=self.frame.f_globals,
+                parent=self.shell,
+            )
+        with provisionalcompleter():
+            completions = list(self._completer.completions(text, column))
+        return [
+            {
+                "label": c.text,
+                "type": _IPYTHON_TYPES.get(c.type, "text"),
+                "start": c.start,
+                "length": c.end - c.start,
+            }
+            for c in completions
+        ]
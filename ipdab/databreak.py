@@ -0,0 +1,211 @@
+import copy
+import weakref
+
+_MISSING = object()
+
+#: Values of these types are compared by equality when their identity changes, so that,
+#: e.g., recomputing an equal integer does not count as a change.
+_SCALARS = (int, float, complex, str, bytes, bool, type(None))
+
+#: Mutable containers can change without being rebound, so a shallow copy is kept and
+#: compared, for these types only.
+_CONTAINERS = (list, dict, set, bytearray)
+
+
+class DataBreakpoint:
+    """
+    A watched location: a local variable of one frame, a global, or an attribute.
+
+    Parameters
+    ----------
+    kind : str
+        One of "local", "global" or "attribute".
+    name : str
+        The name of the variable or attribute.
+    owner : object
+        The frame for a local, the globals dict for a global, and the object holding
+        the attribute otherwise. Objects are referenced weakly where possible.
+    description : str
+        How the location is shown to the user.
+    """
+
+    def __init__(self, kind, name, owner, description):
+        self.kind = kind
+        self.name = name
+        self.description = description
+        if kind == "attribute":
+            try:
+                self._owner = weakref.ref(owner)
+            except TypeError:
+                self._owner = lambda: owner
+        else:
+            self._owner = lambda: owner
+        self._value = _MISSING
+        self._copy = _MISSING
+        self.reset()
+
+    @property
+    def owner(self):
+        return self._owner()
+
+    def read(self):
+        """
+        The current value, or `_MISSING` when it is unbound, the owner is gone, or
+        reading it fails, e.g., in a property of the owner.
+        """
+        owner = self._owner()
+        if owner is None:
+            return _MISSING
+        if self.kind == "local":
+            return owner.f_locals.get(self.name, _MISSING)
+        if self.kind == "global":
+            return owner.get(self.name, _MISSING)
+        try:
+            namespace = getattr(owner, "__dict__", None)
+            if namespace is not None and self.name in namespace:
+                return namespace[self.name]
+            return getattr(owner, self.name, _MISSING)
+        except Exception:
+            return _MISSING
+
+    @staticmethod
+    def _copy_of(value):
+        if not isinstance(value, _CONTAINERS):
+            return _MISSING
+        try:
+            return copy.copy(value)
+        except Exception:
+            return _MISSING
+
+    def reset(self):
+        """Take the current value as the reference to detect changes against."""
+        self._value = value = self.read()
+        self._copy = self._copy_of(value)
+
+    @staticmethod
+    def _same_items(value, old):
+        """Compare a container to its shallow copy by the identity of the items."""
+        if isinstance(value, dict):
+            return value.keys() == old.keys() and all(value[k] is old[k] for k in old)
+        if isinstance(value, set):
+            return {id(item) for item in value} == {id(item) for item in old}
+        return all(a is b for a, b in zip(value, old))
+
+    def changed(self):
+        """
+        Whether the value changed since the last call (or `reset`), cheapest check first.
+
+        Rebinding is detected by identity. Only if the identity is unchanged and the value
+        is a mutable container, the container is compared against its shallow copy, and
+        only if its identity changed and the value is a scalar, it is compared by value.
+
+        This runs in the trace function, so it never raises into the program. Items that
+        cannot be compared by equality, like NumPy arrays, are compared by identity.
+        """
+        value = self.read()
+        old = self._value
+        if value is old:
+            if self._copy is _MISSING:
+                return False
+            try:
+                same = len(value) == len(self._copy) and bool(value == self._copy)
+            except Exception:
+                try:
+                    same = self._same_items(value, self._copy)
+                except Exception:
+                    # E.g. changed size while iterating, by another thread
+                    same = False
+        elif isinstance(value, _SCALARS) and type(value) is type(old):
+            try:
+                same = bool(value == old)
+            except Exception:
+                same = False
+        else:
+            same = False
+        if not same:
+            self._value = value
+            self._copy = self._copy_of(value)
+        return not same
+
+    def touches(self, code):
+        """Whether frames running `code` could possibly write to this location."""
+        if self.kind == "local":
+            return code is self.owner.f_code
+        return self.name in code.co_names
+
+
+class DataWatcher:
+    """
+    The data breakpoints of a debugger, and which code needs checking for them.
+
+    Checking every breakpoint on every line of the program would make a traced program
+    crawl. Instead, a frame is only checked if its code object can write to a watched
+    location: the frame owning a watched local, or code that stores the watched name as
+    a global or attribute, i.e., has it in `co_names`. The verdict is cached per code
+    object, so untouched code costs one dict lookup per call.
+    """
+
+    def __init__(self):
+        self._breakpoints = ()
+        self._relevant = {}
+        self._candidates = {}
+
+    def __bool__(self):
+        return bool(self._breakpoints)
+
+    def describe(self, kind, name, owner, description):
+        """Register a location that may be watched, and return its data id."""
+        data_id = f"{kind}:{id(owner)}:{name}"
+        self._candidates[data_id] = (kind, name, owner, description)
+        return data_id
+
+    def set(self, data_ids):
+        """
+        Replace the data breakpoints by those for `data_ids` from :meth:`describe`.
+
+        Returns, for each data id, the breakpoint, or None if the id is unknown.
+        """
+        current = {f"{bp.kind}:{id(bp.owner)}:{bp.name}": bp for bp in self._breakpoints}
+        breakpoints = []
+        for data_id in data_ids:
+            bp = current.get(data_id)
+            if bp is None and data_id in self._candidates:
+                bp = DataBreakpoint(*self._candidates[data_id])
+            breakpoints.append(bp)
+        self._breakpoints = tuple(bp for bp in breakpoints if bp is not None)
+        self._candidates = {}
+        self._relevant = {}
+        return breakpoints
+
+    def forget_candidates(self):
+        """Forget the locations described since the last :meth:`set`, and their owners."""
+        self._candidates = {}
+
+    def frames(self):
+        """The frames owning watched locals."""
+        return [bp.owner for bp in self._breakpoints if bp.kind == "local"]
+
+    def relevant(self, code):
+        """The breakpoints that frames running `code` could change."""
+        try:
+            return self._relevant[code]
+        except KeyError:
+            pass
+        relevant = tuple(bp for bp in self._breakpoints if bp.touches(code))
+        self._relevant[code] = relevant
+        return relevant
+
+    def check(self, code):
+        """The first breakpoint relevant for `code` whose value changed, or None."""
+        for bp in self.relevant(code):
+            if bp.changed():
+                return bp
+        return None
+
+    def drop_frame(self, frame):
+        """Forget the locals of `frame`, which is returning."""
+        if any(bp.kind == "local" and bp.owner is frame for bp in self._breakpoints):
+            self._breakpoints = tuple(
+                bp for bp in self._breakpoints if not (bp.kind == "local" and bp.owner is frame)
+            )
+            self._relevant = {}
@@ -4,13 +4,27 @@ import os
 import pdb
 import pkgutil
 import re
+import runpy
 import site
 import sys
 import sysconfig
+import threading
+import time
 from abc import ABC, abstractmethod
 from bdb import BdbQuit
 
+from IPython.core.getipython import get_ipython
 from IPython.terminal.debugger import TerminalPdb
+from IPython.terminal.interactiveshell import TerminalInteractiveShell
+
+from .databreak import DataWatcher
+from .funcindex import FunctionIndex, ImportWatcher
+from .history import History
+from .metrics import NULL_METRICS
+from .modules import ModuleIndex
+from .profiling import StopProfiler
+from .snapshot import StopSnapshot
+from .watches import WatchRegistry
 
 #: Modules that drive the debugger itself. Stepping into these is always an accident,
 #: so they are skipped on top of whatever :class:`SkipMatcher` classifies as library code.
@@ -21,6 +35,10 @@ DEFAULT_SKIP = (
     "threading",
 )
 
+#: The internals of the event loop, skipped when debugging asyncio programs so that
+#: stepping goes from one coroutine to the next instead of through the scheduler.
+ASYNCIO_SKIP = ("asyncio", "asyncio.*")
+
 _WILDCARD = re.compile(r"[*?\[]")
 
 
@@ -65,6 +83,11 @@ class SkipMatcher:
     - Every answer is memoised. Trace events repeat the same handful of module
       names endlessly, so the second lookup onwards is a dict hit.
 
+    The compiled configuration and the memoised answers live in one :class:`_SkipState`,
+    which :meth:`reconfigure` replaces as a whole. The trace function of the debuggee
+    may be looking up modules while the adapter reconfigures, and either gets an answer
+    from the old configuration, or from the new one, never a mix of both.
+
     Parameters
     ----------
     patterns : iterable of str, optional
@@ -76,14 +99,88 @@ class SkipMatcher:
     unskip : iterable of str, optional
         `fnmatch` patterns that win over `skip_libraries`, to step into one library
         anyway. Explicit `patterns` still take precedence over these.
+    rules : iterable of dict, optional
+        Ordered rules, as in the launch configuration of debugpy: ``{"module": pattern,
+        "include": bool}`` or ``{"path": pattern, "include": bool}``, with `path` an
+        `fnmatch` pattern of the file of the module. The first matching rule decides,
+        after the explicit `patterns` and before `unskip` and `skip_libraries`.
     """
 
-    def __init__(self, patterns=(), skip_libraries=True, unskip=()):
-        self._literals, self._regex = self._compile(patterns)
-        self._unskip_literals, self._unskip_regex = self._compile(unskip)
+    def __init__(self, patterns=(), skip_libraries=True, unskip=(), rules=()):
+        self._state = _SkipState(patterns, skip_libraries, unskip, rules)
+        # Number of lookups that missed the cache
+        self.misses = 0
+
+    @property
+    def patterns(self):
+        return self._state.patterns
+
+    @property
+    def skip_libraries(self):
+        return self._state.skip_libraries
+
+    @property
+    def roots(self):
+        return self._state.roots
+
+    @property
+    def _cache(self):
+        return self._state.cache
+
+    def extend(self, patterns):
+        """Add skip `patterns`, forgetting every answer given so far."""
+        patterns = tuple(p for p in patterns if p not in self.patterns)
+        if patterns:
+            self.reconfigure(patterns=self.patterns + patterns)
+
+    def remove(self, patterns):
+        """Remove skip `patterns`, forgetting every answer given so far."""
+        kept = tuple(p for p in self.patterns if p not in patterns)
+        if kept != self.patterns:
+            self.reconfigure(patterns=kept)
+
+    def reconfigure(self, patterns=None, skip_libraries=None, unskip=None, rules=None):
+        """
+        Replace the given parts of the configuration, see the parameters of the class,
+        keeping those that are None, and forget every answer given so far.
+        """
+        state = self._state
+        self._state = _SkipState(
+            state.patterns if patterns is None else patterns,
+            state.skip_libraries if skip_libraries is None else skip_libraries,
+            state.unskip if unskip is None else unskip,
+            state.rules if rules is None else rules,
+        )
+
+    def __call__(self, module_name):
+        if module_name is None:  # some modules do not have names
+            return False
+        state = self._state
+        try:
+            return state.cache[module_name]
+        except KeyError:
+            self.misses += 1
+        result = state.classify(module_name)
+        # Only remember a negative verdict once the module is importable, otherwise a
+        # lookup made before the import completed would pin it to "user code" forever.
+        if result or module_name in sys.modules:
+            state.cache[module_name] = result
+        return result
+
+
+class _SkipState:
+    """The compiled configuration of a :class:`SkipMatcher`, and its memoised answers."""
+
+    def __init__(self, patterns, skip_libraries, unskip, rules):
+        self.patterns = tuple(patterns or ())
         self.skip_libraries = skip_libraries
+        self.unskip = tuple(unskip or ())
+        self.rules = tuple(rules or ())
+        self.literals, self.regex = self._compile(self.patterns)
+        self.unskip_literals, self.unskip_regex = self._compile(self.unskip)
+        self.compiled_rules = [self._compile_rule(rule) for rule in self.rules]
         self.roots = library_roots() if skip_libraries else frozenset()
-        self._cache = {}
+        self.cache = {}
 
     @staticmethod
     def _compile(patterns):
@@ -98,47 +195,64 @@ class SkipMatcher:
             regex = re.compile("|".join(fnmatch.translate(p) for p in wildcards))
         return literals, regex
 
+    @staticmethod
+    def _compile_rule(rule):
+        """A rule as `(matches path, regex, skip)`."""
+        if "path" in rule:
+            pattern = os.path.normcase(os.path.expanduser(rule["path"]))
+            return True, re.compile(fnmatch.translate(pattern)), not rule.get("include", True)
+        if "module" in rule:
+            return (
+                False,
+                re.compile(fnmatch.translate(rule["module"])),
+                not rule.get("include", True),
+            )
+        raise ValueError(f"A skip rule needs a path or a module: {rule!r}")
+
     @staticmethod
     def _matches(module_name, literals, regex):
         if module_name in literals:
             return True
         return regex is not None and regex.match(module_name) is not None
 
+    @staticmethod
+    def _filename(module_name):
+        """The real path of the file of `module_name`, or None if it has none."""
+        filename = getattr(sys.modules.get(module_name), "__file__", None)
+        if filename is None:
+            return None
+        return os.path.normcase(os.path.realpath(filename))
+
     def _is_library(self, module_name):
         """Whether `module_name` resolves to a file below one of :attr:`roots`."""
         module = sys.modules.get(module_name)
         if module is None:
             # Not imported (or synthetic globals from exec): assume user code and trace it.
             return False
-        filename = getattr(module, "__file__", None)
+        filename = self._filename(module_name)
         if filename is None:
-            return True  # builtin or frozen, there is no source to step through
-        filename = os.path.normcase(os.path.realpath(filename))
+            # Builtin or frozen, there is no source to step through. Other modules without
+            # a file, like the namespace of an interactive IPython shell, are user code.
+            spec = getattr(module, "__spec__", None)
+            return getattr(spec, "origin", None) in ("built-in", "frozen")
         return any(filename == root or filename.startswith(root + os.sep) for root in self.roots)
 
-    def _classify(self, module_name):
-        if self._matches(module_name, self._literals, self._regex):
+    def classify(self, module_name):
+        if self._matches(module_name, self.literals, self.regex):
             return True
+        for by_path, regex, skip in self.compiled_rules:
+            if by_path:
+                filename = self._filename(module_name)
+                if filename is not None and regex.match(filename):
+                    return skip
+            elif regex.match(module_name):
+                return skip
         if not self.skip_libraries:
             return False
-        if self._matches(module_name, self._unskip_literals, self._unskip_regex):
+        if self._matches(module_name, self.unskip_literals, self.unskip_regex):
             return False
         return self._is_library(module_name)
 
-    def __call__(self, module_name):
-        if module_name is None:  # some modules do not have names
-            return False
-        try:
-            return self._cache[module_name]
-        except KeyError:
-            pass
-        result = self._classify(module_name)
-        # Only remember a negative verdict once the module is importable, otherwise a
-        # lookup made before the import completed would pin it to "user code" forever.
-        if result or module_name in sys.modules:
-            self._cache[module_name] = result
-        return result
-
 
 def _stdlib_skip_patterns():
     """
@@ -183,6 +297,13 @@ class CustomDebugger(ABC):
         self._skip_matcher = SkipMatcher(
             patterns=skip, skip_libraries=skip_libraries, unskip=unskip
         )
+        # Only one thread at a time can own the prompt, and only that one is stepped
+        self._interaction_lock = threading.RLock()
+        self._stepping_thread = None
+        self._threads_armed = False
+        self._data_watcher = DataWatcher()
+        # Whether line events of a code object are recorded in the history
+        self._recorded = {}
 
     def is_skipped_module(self, module_name):
         """
@@ -193,6 +314,208 @@ class CustomDebugger(ABC):
         """
         return self._skip_matcher(module_name)
 
+    def instrument(self, metrics):
+        """
+        Count trace callbacks per event and lookups of the :class:`SkipMatcher` in
+        `metrics`.
+
+        The counting wrappers are installed as instance attributes, so that without
+        instrumentation the dispatch path is exactly that of `bdb`. They take effect the
+        next time the trace function is installed, i.e., at the next continue or step.
+        """
+        if "trace_dispatch" in vars(self):
+            return
+        trace_dispatch = self.trace_dispatch
+        is_skipped_module = self.is_skipped_module
+        count = metrics.count
+
+        def counted_trace_dispatch(frame, event, arg):
+            count(f"trace.{event}")
+            return trace_dispatch(frame, event, arg)
+
+        def counted_is_skipped_module(module_name):
+            count("skip.lookups")
+            return is_skipped_module(module_name)
+
+        # Misses from before the instrumentation are not matched by counted lookups
+        misses_before = self._skip_matcher.misses
+
+        def skip_cache():
+            lookups = metrics.counters.get("skip.lookups", 0)
+            misses = self._skip_matcher.misses - misses_before
+            return {
+                "cached": len(self._skip_matcher._cache),
+                "misses": misses,
+                "hitRate": 1 - misses / lookups if lookups else None,
+            }
+
+        self.trace_dispatch = counted_trace_dispatch
+        self.is_skipped_module = counted_is_skipped_module
+        metrics.probe("skip_cache", skip_cache)
+
+    def set_trace(self, frame=None, trace_threads=False):
+        """
+        Start debugging from `frame`, see `bdb.Bdb.set_trace`.
+
+        :param trace_threads: Also arm breakpoints in threads started from now on, with
+            `threading.settrace`. Threads that are already running cannot be traced, and
+            worker threads only ever stop at breakpoints, never while stepping.
+        """
+        if frame is None:
+            frame = sys._getframe().f_back
+        self._stepping_thread = threading.get_ident()
+        if trace_threads:
+            threading.settrace(self.trace_dispatch)
+            self._threads_armed = True
+        return self._debug_base.set_trace(self, frame)
+
+    def run_program(self, target, module=False):
+        """
+        Run the script at path `target`, or the module `target` if `module`, as
+        `__main__`, stopping only at breakpoints, see :meth:`arm`.
+        """
+        if module:
+            return self.run_armed(runpy.run_module, target, run_name="__main__", alter_sys=True)
+        return self.run_armed(runpy.run_path, target, run_name="__main__")
+
+    def arm(self, step=False):
+        """
+        Stop at breakpoints in the code the current thread runs from here on, as after a
+        continue, or at its first line if `step`.
+
+        Without `step`, the thread is only traced if there are breakpoints, and then
+        `bdb` only traces the lines of functions in files with breakpoints. Without
+        breakpoints, the code runs untraced until it calls `set_trace`.
+        """
+        self.reset()
+        # Quitting ends the code run by the caller, not the debugger
+        self.quitting = False
+        self._exited = False
+        self._stepping_thread = threading.get_ident()
+        if step:
+            # `bdb` takes the frame of the first call as the bottom, and skips its call
+            # event, so the first stop is on the first line, as in `pdb.run`
+            self._set_stopinfo(None, None)
+        else:
+            self.botframe = sys._getframe(1)
+            self._set_stopinfo(self.botframe, None, -1)
+        if step or self.breaks:
+            sys.settrace(self.trace_dispatch)
+
+    def disarm(self):
+        """Stop tracing the current thread, if :meth:`arm` traced it."""
+        self._parent.profiler.cancel()
+        if sys.gettrace() == self.trace_dispatch:
+            sys.settrace(None)
+
+    def run_armed(self, func, *args, step=False, **kwargs):
+        """Call `func` with the debugger armed, see :meth:`arm`."""
+        self.arm(step)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._parent.profiler.cancel()
+            sys.settrace(None)
+
+    def arm_breakpoints(self):
+        """
+        Trace the current thread for breakpoints again, if `bdb` dropped its trace
+        function on continue because there were no breakpoints at the time.
+        """
+        if self.botframe is not None and not self.quitting and sys.gettrace() is None:
+            sys.settrace(self.trace_dispatch)
+
+    def disarm_threads(self):
+        """Stop tracing threads that are started from now on."""
+        if self._threads_armed:
+            threading.settrace(None)
+            self._threads_armed = False
+
+    def stop_here(self, frame):
+        """
+        Override of `bdb.Bdb.stop_here` that only steps the thread owning the prompt.
+
+        `bdb` keeps a single set of stepping state, so without this check a `step` in
+        one thread would stop every other traced thread on its next line.
+        """
+        if self._threads_armed and threading.get_ident() != self._stepping_thread:
+            return False
+        return self._debug_base.stop_here(self, frame)
+
+    def interaction(self, frame, traceback):
+        """
+        Serialise stops of different threads, so only one of them prompts at a time.
+        Also ends the profile since the last continue, if profiling, and keeps the prompt
+        out of the captured output of the program.
+        """
+        with self._interaction_lock:
+            self._stepping_thread = threading.get_ident()
+            report = self._parent.profiler.stop()
+            if report is not None:
+                self._parent.profile = report
+            output = self._parent.output
+            if output is not None:
+                output.pause()
+            try:
+                return self._debug_base.interaction(self, frame, traceback)
+            finally:
+                if output is not None:
+                    output.resume()
+
+    def break_anywhere(self, frame):
+        """
+        Override of `bdb.Bdb.break_anywhere` that also traces frames that could change a
+        data breakpoint. Other frames are not traced line by line.
+        """
+        if self._data_watcher and self._data_watcher.relevant(frame.f_code):
+            return True
+        if self._parent.history and self._is_recorded(frame):
+            return True
+        return self._debug_base.break_anywhere(self, frame)
+
+    def _is_recorded(self, frame):
+        """Whether `frame` runs user code, whose line events go into the history."""
+        try:
+            return self._recorded[frame.f_code]
+        except KeyError:
+            module_name = frame.f_globals.get("__name__")
+            if module_name is None:
+                # E.g. module globals that are cleared at interpreter shutdown
+                return False
+            recorded = not self.is_skipped_module(module_name)
+            self._recorded[frame.f_code] = recorded
+            return recorded
+
+    def dispatch_line(self, frame):
+        history = self._parent.history
+        if history and self._is_recorded(frame):
+            history.record(frame, threading.get_ident())
+        if self._data_watcher:
+            bp = self._data_watcher.check(frame.f_code)
+            if bp is not None:
+                return self._stop_on_data(frame, bp)
+        return self._debug_base.dispatch_line(self, frame)
+
+    def dispatch_return(self, frame, arg):
+        if self._data_watcher:
+            bp = self._data_watcher.check(frame.f_code)
+            self._data_watcher.drop_frame(frame)
+            if bp is not None:
+                return self._stop_on_data(frame, bp)
+        return self._debug_base.dispatch_return(self, frame, arg)
+
+    def _stop_on_data(self, frame, bp):
+        """Stop because the value watched by data breakpoint `bp` changed."""
+        self._parent.stop_reason = "data breakpoint"
+        self._parent.stop_text = f"{bp.description} changed"
+        try:
+            self.interaction(frame, None)
+        finally:
+            self._parent.stop_reason = self._parent.stop_text = None
+        if self.quitting:
+            raise BdbQuit
+        return self.trace_dispatch
+
     def preloop(self):
         """
         Whenever the debug stops somewhere, it will open a prompt in the `cmdloop`.
@@ -219,24 +542,24 @@ class CustomDebugger(ABC):
         With in the command loop, each time a command is submitted, the following methods
         are called in order: the hook `precmd` before the execution of the command,
         the method `onecmd` to execute the command, and the method `postcmd` after the command is executed.
+
+        `stop` is true if the command lets the program run again, which ends the stop.
         """
-        # TODO: why do we notify here, wouldn't it make more sense to overload do_next or do_step?
         try:
             cmd = line.strip().lower()
-            if (
-                cmd in {"n", "s", "step", "next", "unt", "until"}
-                or cmd.startswith("j ")
-                or cmd.startswith("jump ")
-                or cmd.startswith("unt ")
-                or cmd.startswith("until ")
-            ):
+            if stop:
+                # The program runs again, e.g., after `next` or `continue`. The stop is
+                # notified again once it stops, in `preloop`.
+                self._parent._on_resume()
+            elif cmd.startswith("j ") or cmd.startswith("jump "):
+                # The line changed without running the program, so without a new prompt
                 if self.curframe is None:
                     logging.error(
                         f"[DEBUGGER] Post command '{cmd}' received while curframe is None"
                     )
                 self._parent._on_stop(self.curframe)
             else:
-                logging.debug(f"[DEBUGGER] Post command '{cmd}' received; no action taken")
+                logging.debug("[DEBUGGER] Post command %r received; no action taken", cmd)
         except Exception as e:
             logging.error(f"[DEBUGGER] Error in postcmd: {e}")
         return self._debug_base.postcmd(self, stop, line)
@@ -257,16 +580,34 @@ class CustomDebugger(ABC):
         if self._parent.on_continue_callback is not None:
             on_continue = self._parent.on_continue_callback()
             if on_continue == "exit_without_breakpoint":
-                if not self.breaks:
+                if not self.breaks and not self._data_watcher:
                     self.call_on_exit_once()
             elif on_continue == "exit":
                 self.call_on_exit_once()
             elif on_continue == "keep_running":
-                # TODO: try to do something here
+                # The server, and any client, stay for the next `set_trace` or breakpoint
                 pass
             else:
                 raise ValueError(f"Invalid on_continue return value: {on_continue}")
-        self._debug_base.set_continue(self)
+        if not self.breaks:
+            self.disarm_threads()
+        if self._data_watcher or self._parent.history:
+            # Unlike `bdb`, keep tracing without breakpoints, for the data breakpoints
+            # and the history
+            self._set_stopinfo(self.botframe, None, -1)
+            sys.settrace(self.trace_dispatch)
+            for frame in self._data_watcher.frames():
+                frame.f_trace = self.trace_dispatch
+        else:
+            self._debug_base.set_continue(self)
+        # Without a trace function, nothing but another `set_trace` would end the profile
+        if not self._exited and sys.gettrace() is not None:
+            self._parent.profiler.start()
+
+    def set_until(self, frame, lineno=None):
+        """Profile up to the next stop, see :class:`StopProfiler`."""
+        self._debug_base.set_until(self, frame, lineno)
+        self._parent.profiler.start()
 
     def set_quit(self):
         """
@@ -276,6 +617,8 @@ class CustomDebugger(ABC):
         the `set_trace` method merely injects callbacks into the interpreter that cause the
         debugger to stop at breakpoints and such.
         """
+        self.disarm_threads()
+        self._parent.profiler.cancel()
         self.call_on_exit_once()
         return self._debug_base.set_quit(self)
 
@@ -287,6 +630,7 @@ class CustomDebugger(ABC):
         if self._exited:
             return
         else:
+            self._parent.profiler.cancel()
             self._parent._on_exit()
             self._exited = True
 
@@ -343,6 +687,15 @@ class CustomPdb(CustomDebugger, pdb.Pdb):
         pdb.Pdb.__init__(self, *args, skip=skip, **kwargs)
 
 
+def _can_prompt_ipdb():
+    """
+    Whether the ipdb backend can run, which prompts with the terminal of IPython: outside
+    IPython, or in a terminal IPython shell, but not in a kernel or another shell.
+    """
+    shell = get_ipython()
+    return shell is None or isinstance(shell, TerminalInteractiveShell)
+
+
 class Debugger:
     def __init__(
         self,
@@ -351,12 +704,21 @@ class Debugger:
         stopped_callback=None,
         exited_callback=None,
         on_continue_callback=None,
+        breakpoint_callback=None,
+        resumed_callback=None,
         **kwargs,
     ):
         backend = backend.lower()
         self.stopped_callback = stopped_callback
         self.exited_callback = exited_callback
         self.on_continue_callback = on_continue_callback
+        self.breakpoint_callback = breakpoint_callback
+        self.resumed_callback = resumed_callback
+        if backend == "ipdb" and not _can_prompt_ipdb():
+            logging.info(
+                "[DEBUGGER] The ipdb backend needs a terminal IPython shell, using pdb instead"
+            )
+            backend = "pdb"
         if backend == "ipdb":
             self.debugger = CustomTerminalPdb(self, *args, **kwargs)
         elif backend == "pdb":
@@ -365,39 +727,380 @@ class Debugger:
             raise ValueError(f"Unsupported debugger: {backend}. Use 'ipdb' or 'pdb'.")
 
         self.backend = backend
+        self.metrics = NULL_METRICS
+        self.snapshot = None
+        # The exception being inspected in post mortem mode
+        self.exception = None
+        # Overrides the reason of the next stop, e.g., for data breakpoints
+        self.stop_reason = None
+        self.stop_text = None
+        self.watches = WatchRegistry()
+        self.profiler = StopProfiler()
+        self.profile = None
+        self.history = History()
+        # The capture of the output of the program, paused while prompting, if any
+        self.output = None
+        # Looked up on every call, so the lookups are counted once instrumented
+        self.modules = ModuleIndex(
+            lambda module_name: self.debugger.is_skipped_module(module_name)
+        )
+        # The event of the history that is shown instead of the live stop, if any
+        self.history_position = None
+        self._live_snapshot = None
+        # The event of the live stop, or the length of the history if it has none
+        self._live_position = None
+        self.functions = FunctionIndex()
+        self.function_breakpoints = []
+        self._next_function_breakpoint = 1
+        self._import_watcher = ImportWatcher(self._on_import)
+        # Skip patterns from the last `configure_skipping`
+        self._configured_skip = ()
+
+    def instrument(self, metrics):
+        """Record metrics of the debugger in `metrics`, see :mod:`ipdab.metrics`."""
+        self.metrics = metrics
+        self.debugger.instrument(metrics)
+
+    def skip_modules(self, patterns):
+        """Never stop in modules matching `patterns`, on top of the configured skips."""
+        self.debugger._skip_matcher.extend(patterns)
+        self.debugger._recorded = {}
+
+    def unskip_modules(self, patterns):
+        """
+        Undo :meth:`skip_modules` for `patterns`, except for the patterns the debugger
+        always skips, and those of :meth:`configure_skipping`.
+        """
+        kept = set(DEFAULT_SKIP) | set(self._configured_skip)
+        self.debugger._skip_matcher.remove([p for p in patterns if p not in kept])
+        self.debugger._recorded = {}
+
+    def configure_skipping(self, just_my_code=None, skip=None, unskip=None, rules=None):
+        """
+        Reconfigure which modules the debugger steps over, e.g., from the launch
+        configuration of the client. Arguments that are None are left as they are.
+
+        :param just_my_code: Skip the standard library and site-packages.
+        :param skip: `fnmatch` patterns of modules to skip. They replace the patterns of
+            the previous call, the patterns the debugger always skips are kept.
+        :param unskip: Patterns of library modules to step into anyway.
+        :param rules: Ordered module and path rules, see :class:`SkipMatcher`.
+        """
+        matcher = self.debugger._skip_matcher
+        patterns = None
+        if skip is not None:
+            configured = set(self._configured_skip) - set(DEFAULT_SKIP)
+            patterns = [p for p in matcher.patterns if p not in configured] + list(skip)
+            self._configured_skip = tuple(skip)
+        matcher.reconfigure(
+            patterns=patterns, skip_libraries=just_my_code, unskip=unskip, rules=rules
+        )
+        self.debugger._recorded = {}
 
     def clear_exited(self):
         self.debugger._exited = False
 
     def _on_stop(self, frame):
+        self.history_position = self._live_snapshot = None
+        self.snapshot = StopSnapshot(frame, getattr(self.debugger, "stack", None))
+        if self.metrics:
+            self.metrics.observe("stop.snapshot", time.perf_counter() - self.snapshot.time)
+        if self.watches and frame is not None:
+            self.snapshot.watches = self.watches.evaluate(frame)
+        self.snapshot.modules = self.modules.update()
+        # Only reported with the first notification of the stop
+        self.snapshot.profile, self.profile = self.profile, None
         if self.stopped_callback:
-            self.stopped_callback(reason="breakpoint")
+            reason = self.stop_reason
+            if reason is None:
+                reason = "breakpoint" if self.exception is None else "exception"
+            self.stopped_callback(reason=reason, thread_id=self.snapshot.thread_id)
+
+    def _on_resume(self):
+        """
+        The program runs again: release everything that was captured at the stop, so
+        frames and the objects they reference are not kept alive by the debugger.
+        """
+        snapshot = self._live_snapshot or self.snapshot
+        for captured in (self.snapshot, self._live_snapshot):
+            if captured is not None:
+                captured.release()
+        self.snapshot = self._live_snapshot = self.history_position = None
+        self.debugger._data_watcher.forget_candidates()
+        # `pdb` only replaces these at the next stop, `forget` leaves them be
+        self.debugger.curframe_locals = {}
+        completer = getattr(getattr(self.debugger, "_ptcomp", None), "ipy_completer", None)
+        if completer is not None:
+            completer.namespace = completer.global_namespace = {}
+        if snapshot is not None and self.resumed_callback:
+            self.resumed_callback(thread_id=snapshot.thread_id)
 
     def _on_exit(self):
         if self.exited_callback:
             self.exited_callback(reason="exited")
 
-    def set_trace(self, frame=None):
+    def set_trace(self, frame=None, trace_threads=False):
+        self.exception = None
         try:
-            return self.debugger.set_trace(frame=frame)
+            return self.debugger.set_trace(frame=frame, trace_threads=trace_threads)
         except (BdbQuit, SystemExit):
             self.debugger.call_on_exit_once()
         except Exception as e:
             logging.error(f"[DEBUGGER] Error in set_trace: {e}")
             raise
 
+    def run(self, target, module=False):
+        """
+        Run a script, or a module if `module`, under the debugger, see
+        :meth:`CustomDebugger.run_program`.
+        """
+        self.exception = None
+        try:
+            return self.debugger.run_program(target, module=module)
+        except BdbQuit:
+            self.debugger.call_on_exit_once()
+
+    def run_code(self, code, globals, locals=None, step=False):
+        """
+        Execute `code` in `globals` and `locals`, stopping only at breakpoints, or at the
+        first line if `step`, see :meth:`CustomDebugger.arm`.
+        """
+        self.exception = None
+        try:
+            return self.debugger.run_armed(exec, code, globals, locals, step=step)
+        except BdbQuit:
+            self.debugger.call_on_exit_once()
+
+    def arm(self):
+        """Stop at breakpoints in the code this thread runs from here on."""
+        self.exception = None
+        self.debugger.arm()
+
+    def disarm(self):
+        self.debugger.disarm()
+
+    def post_mortem(self, traceback, exception=None):
+        """
+        Inspect the frames of `traceback`, like `pdb.post_mortem`.
+
+        :param exception: The exception the traceback belongs to, reported to the client
+            in the stopped event and the `exceptionInfo` request.
+        """
+        self.exception = exception
+        try:
+            self.debugger.reset()
+            self.debugger.interaction(None, traceback)
+        except (BdbQuit, SystemExit):
+            self.debugger.call_on_exit_once()
+        except Exception as e:
+            logging.error(f"[DEBUGGER] Error in post_mortem: {e}")
+            raise
+        finally:
+            # There is nothing left to run to the next stop
+            self.profiler.cancel()
+            self.exception = None
+
+    def step_back(self, reverse_continue=False):
+        """
+        Show the previous line event of the stopped thread from the history, or with
+        `reverse_continue`, the previous one on a breakpoint, or else the oldest one.
+
+        Returns the reason to report the stop with, "breakpoint" if it is on a
+        breakpoint, "step" otherwise, or None if there was no event to go back to.
+        """
+        if self.history_position is None:
+            self._live_snapshot = self.snapshot
+            # With several threads traced, the newest event can be of another thread
+            position = self._live_position = self._live_event()
+        else:
+            position = self.history_position
+        ident = self._live_snapshot.ident
+        position = self.history.previous(position, ident)
+        if position is None:
+            return None
+        reason = "step"
+        if reverse_continue:
+            breaks = self.get_all_breaks()
+            while True:
+                code, lineno = self.history.location(position)
+                if lineno in breaks.get(self.debugger.canonic(code.co_filename), ()):
+                    reason = "breakpoint"
+                    break
+                previous = self.history.previous(position, ident)
+                if previous is None:
+                    break
+                position = previous
+        self._show_history(position)
+        return reason
+
+    def step_forward(self):
+        """
+        Show the next line event of the stopped thread from the history, or the live
+        stop again after the newest event.
+        """
+        position = self.history.next(self.history_position, self._live_snapshot.ident)
+        if position is None or position == self._live_position:
+            self.go_live()
+        else:
+            self._show_history(position)
+
+    def _live_event(self):
+        """
+        The position of the event the stopped thread is stopped at, or the length of the
+        history if the stop is not on a recorded line, e.g., on a return.
+        """
+        ident = self._live_snapshot.ident
+        position = self.history.previous(len(self.history), ident)
+        if position is None:
+            return len(self.history)
+        code, lineno = self.history.location(position)
+        frame = self._live_snapshot.top_frame
+        if frame is None or frame.f_code is not code or frame.f_lineno != lineno:
+            return len(self.history)
+        return position
+
+    def go_live(self):
+        """Stop showing the history, and show the live stop again."""
+        if self.history_position is not None:
+            self.snapshot = self._live_snapshot
+            self.history_position = self._live_snapshot = None
+
+    def _show_history(self, position):
+        frame = self.history.frame(position)
+        self.history_position = position
+        # Built in the adapter thread, so the threads are those of the live stop
+        self.snapshot = StopSnapshot(frame, [(frame, frame.f_lineno)], live=self._live_snapshot)
+
+    @property
+    def in_history(self):
+        return self.history_position is not None
+
     def get_all_breaks(self):
         if hasattr(self.debugger, "get_all_breaks"):
             return self.debugger.get_all_breaks()
         else:
             return getattr(self.debugger, "breaks", {})
 
-    def set_break(self, filename, lineno):
-        self.debugger.set_break(filename, lineno)
+    def set_break(self, filename, lineno, **kwargs):
+        return self.debugger.set_break(filename, lineno, **kwargs)
 
     def clear_break(self, filename, lineno):
         self.debugger.clear_break(filename, lineno)
 
+    def clear_source_breaks(self, filename):
+        """
+        Clear the breakpoints in `filename`, as the `setBreakpoints` request replaces
+        them, but not the function breakpoints that happen to be in it.
+        """
+        function_bps = {bp["breakpoint"] for bp in self.function_breakpoints if bp["code"]}
+        filename = self.debugger.canonic(filename)
+        for lineno in list(self.get_all_breaks().get(filename, ())):
+            for bp in list(self.debugger.get_breaks(filename, lineno)):
+                if bp not in function_bps:
+                    self.debugger.clear_bpbynumber(bp.number)
+
+    def set_function_breakpoints(self, breakpoints):
+        """
+        Replace the function breakpoints.
+
+        :param breakpoints: `(name, condition)` pairs, with `name` as accepted by
+            :meth:`FunctionIndex.resolve`.
+        :return: A dict per breakpoint with its `id`, `name`, `code`, `message`, and the
+            `bdb.Breakpoint` as `breakpoint` once it is set. The code is None while the breakpoint is pending, i.e., its module is not
+            imported yet. Pending breakpoints are set once the module is imported, and
+            then reported through `breakpoint_callback`.
+        """
+        for bp in self.function_breakpoints:
+            if bp["code"] is not None:
+                # Only this breakpoint, not one set on the same line by `setBreakpoints`
+                self.debugger.clear_bpbynumber(bp["breakpoint"].number)
+        self.function_breakpoints = []
+        for name, condition in breakpoints:
+            bp = {"id": self._next_function_breakpoint, "name": name, "condition": condition}
+            self._next_function_breakpoint += 1
+            self._resolve_function_breakpoint(bp)
+            self.function_breakpoints.append(bp)
+        if any(bp["code"] is None for bp in self.function_breakpoints):
+            self._import_watcher.install()
+        else:
+            self._import_watcher.uninstall()
+        return self.function_breakpoints
+
+    def _resolve_function_breakpoint(self, bp):
+        found = self.functions.resolve(bp["name"])
+        bp["code"] = None
+        if found is None:
+            bp["message"] = f"Function {bp['name']} not found, waiting for it to be imported"
+            return False
+        module_name, code = found
+        if code is None:
+            bp["message"] = f"Waiting for module {module_name} to be imported"
+            return False
+        error = self.set_break(
+            code.co_filename, code.co_firstlineno, cond=bp["condition"], funcname=code.co_name
+        )
+        if error:
+            bp["message"] = error
+            return False
+        bp["code"] = code
+        # The `bdb.Breakpoint` just set, the last one on its line
+        bp["breakpoint"] = self.debugger.get_breaks(code.co_filename, code.co_firstlineno)[-1]
+        bp["message"] = None
+        return True
+
+    def _on_import(self, module):
+        """Set the pending function breakpoints that `module` defines."""
+        self.functions.add(module)
+        resolved = [
+            bp
+            for bp in self.function_breakpoints
+            if bp["code"] is None and self._resolve_function_breakpoint(bp)
+        ]
+        if not any(bp["code"] is None for bp in self.function_breakpoints):
+            self._import_watcher.uninstall()
+        if resolved:
+            self.debugger.arm_breakpoints()
+            if self.breakpoint_callback:
+                for bp in resolved:
+                    self.breakpoint_callback(bp)
+
+    def describe_data(self, frame, name, scope=None):
+        """
+        Resolve `name` in `frame` to a location a data breakpoint can watch.
+
+        `name` is a variable, or a dotted expression for an attribute like ``self.total``.
+        A plain name is looked up in `scope` ("locals" or "globals"), by default in the
+        locals first.
+
+        Returns a `(data_id, description)` pair, with a None data id and the reason as
+        description if the name cannot be watched.
+        """
+        watcher = self.debugger._data_watcher
+        if "." in name:
+            base, _, attr = name.rpartition(".")
+            try:
+                obj = eval(base, frame.f_globals, frame.f_locals)
+            except Exception as e:
+                return None, f"Cannot evaluate {base}: {e}"
+            return watcher.describe("attribute", attr, obj, name), name
+        if scope == "globals" or (scope is None and name not in frame.f_locals):
+            if name not in frame.f_globals:
+                return None, f"{name} is not defined"
+            description = f"{frame.f_globals.get('__name__')}.{name}"
+            return watcher.describe("global", name, frame.f_globals, description), description
+        if name not in frame.f_locals:
+            return None, f"{name} is not a local of {frame.f_code.co_name}"
+        description = f"{name} in {frame.f_code.co_name}"
+        return watcher.describe("local", name, frame, description), description
+
+    def set_data_breakpoints(self, data_ids):
+        """
+        Replace the data breakpoints, see :meth:`describe_data` for the ids.
+
+        Tracing for them is armed once the program continues.
+        """
+        return self.debugger._data_watcher.set(data_ids)
+
     @property
     def curframe(self):
         return getattr(self.debugger, "curframe", None)
@@ -0,0 +1,96 @@
+"""
+The IPython extension of ipdab, loaded with ``%load_ext ipdab``.
+
+It starts the adapter once, and keeps it for the lifetime of the kernel, so debugging
+a cell costs no setup. It provides the magics:
+
+- ``%ipdab``: inspect the last uncaught exception post mortem, like ``%debug``.
+- ``%ipdab statement``: debug `statement` from its first line.
+- ``%%ipdab``: debug the cell from its first line.
+
+Cells are compiled with a name derived from their source, which is the same every
+time the same source runs. Clients can ask for that name before a cell runs, with the
+Jupyter `dumpCell` request, and set breakpoints in it. Every cell runs with the
+breakpoints armed, see :meth:`ipdab.debugger.CustomDebugger.arm`.
+
+The ipdb backend prompts with the terminal of IPython, so in a kernel, or any other
+shell than the terminal one, the pdb backend is used.
+"""
+
+import hashlib
+
+from IPython.core.compilerop import CachingCompiler
+from IPython.core.magic import Magics, cell_magic, line_magic, magics_class
+from IPython.terminal.interactiveshell import TerminalInteractiveShell
+
+from . import server
+
+
+def cell_name(code):
+    """The name a cell with source `code` is compiled with."""
+    return f"<ipdab-cell-{hashlib.sha1(code.encode()).hexdigest()[:12]}>"
+
+
+@magics_class
+class IpdabMagics(Magics):
+    @line_magic
+    def ipdab(self, line):
+        """
+        Without arguments, inspect the last uncaught exception post mortem, like
+        ``%debug``. With a statement, debug it from its first line.
+        """
+        if not line.strip():
+            return server.pm()
+        self._debug(line)
+
+    @cell_magic("ipdab")
+    def ipdab_cell(self, line, cell):
+        """Debug the cell from its first line."""
+        self._debug(cell)
+
+    def _debug(self, source):
+        shell = self.shell
+        transformed = shell.transform_cell(source)
+        name = shell.compile.cache(transformed, shell.execution_count, raw_code=source)
+        code = shell.compile(transformed, name, "exec")
+        server.ipdab.ensure_running()
+        server.ipdab.debugger.run_code(code, shell.user_ns, step=True)
+
+
+def _pre_run_cell(info):
+    server.ipdab.debugger.arm()
+
+
+def _post_run_cell(result):
+    server.ipdab.debugger.disarm()
+
+
+def load_ipython_extension(ipython):
+    """Start the adapter for the kernel's lifetime, and register the magics."""
+    compiler = ipython.compile
+    # Kernels that name cells by their source already, like ipykernel, keep their names
+    if type(compiler).get_code_name is CachingCompiler.get_code_name:
+        compiler.get_code_name = lambda raw_code, transformed_code, number: cell_name(raw_code)
+    adapter = server.ipdab
+    if adapter.debugger.backend == "ipdb" and not isinstance(ipython, TerminalInteractiveShell):
+        # E.g. imported before the shell of the kernel existed
+        adapter.shutdown()
+        adapter = server.ipdab = server.IPDBAdapterServer(
+            adapter.host, adapter.port, debugger="pdb"
+        )
+    adapter.sources.code_name = lambda code: compiler.get_code_name(code, code, 0)
+    adapter.keep_alive = True
+    adapter.on_continue = "keep_running"
+    adapter.ensure_running()
+    ipython.register_magics(IpdabMagics)
+    ipython.events.register("pre_run_cell", _pre_run_cell)
+    ipython.events.register("post_run_cell", _post_run_cell)
+
+
+def unload_ipython_extension(ipython):
+    ipython.events.unregister("pre_run_cell", _pre_run_cell)
+    ipython.events.unregister("post_run_cell", _post_run_cell)
+    if "get_code_name" in vars(ipython.compile):
+        del ipython.compile.get_code_name
+    server.ipdab.sources.code_name = None
+    server.ipdab.keep_alive = False
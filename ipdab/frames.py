@@ -0,0 +1,128 @@
+import linecache
+import os
+import weakref
+
+
+def _qualname(code):
+    # `co_qualname` is new in Python 3.11
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def _path(filename):
+    """The real path of `filename`, unless it names a source without a file, like a cell."""
+    if filename.startswith("<") and filename.endswith(">"):
+        return filename
+    return os.path.normcase(os.path.realpath(filename))
+
+
+class _CodeInfo:
+    """The metadata of a code object, and the `StackFrame` fields by position in it."""
+
+    __slots__ = ("name", "source", "skipped", "positions", "starts", "templates")
+
+    def __init__(self, name, source, skipped, positions):
+        self.name = name
+        self.source = source
+        self.skipped = skipped
+        self.positions = positions
+        # Column of the statement by line
+        self.starts = {}
+        # (last instruction, line) -> the fields of a `StackFrame`, but its id
+        self.templates = {}
+
+
+class FrameFormatter:
+    """
+    Formats frames as DAP `StackFrame`s, with the metadata of their code cached.
+
+    Everything about a frame that follows from its code object is worked out once per
+    code object: its qualified name, the source with the real path of its file, and
+    whether it is shown `subtle`, as a frame of a module the step filters skip. The
+    columns of a frame are looked up in the positions of its code, by its last
+    instruction, which in an outer frame is the range of the call. The fields of a
+    frame at each position are kept too, so a frame then costs two dictionary lookups
+    and a copy, and a page of 20 frames, as IDEs fetch, is served well within 1 ms.
+
+    Code objects are cached by identity, as equal code objects can come from different
+    files, and held weakly, so the code of cells and other dynamic code is not kept
+    alive by the cache.
+
+    Parameters
+    ----------
+    skipped : callable
+        Called with the name of a module, whether the step filters skip it.
+    sources : SourceRegistry, optional
+        The registry to look up the `sourceReference` of sources without a file in.
+    """
+
+    def __init__(self, skipped, sources=None):
+        self.skipped = skipped
+        self.sources = sources
+        # id(code) -> (weak reference to code, _CodeInfo)
+        self._info = {}
+
+    def clear(self):
+        """Forget all metadata, e.g., when the step filters are reconfigured."""
+        self._info.clear()
+
+    def _forget(self, key, ref):
+        # The id of a dead code object can be reused, only remove its own entry
+        entry = self._info.get(key)
+        if entry is not None and entry[0] is ref:
+            del self._info[key]
+
+    def _code_info(self, code, frame):
+        key = id(code)
+        entry = self._info.get(key)
+        if entry is not None and entry[0]() is code:
+            return entry[1]
+        filename = code.co_filename
+        source = {"path": _path(filename)}
+        reference = self.sources.reference(filename) if self.sources is not None else 0
+        if reference:
+            source = {"path": filename, "sourceReference": reference}
+        module_name = frame.f_globals.get("__name__")
+        skipped = module_name is not None and bool(self.skipped(module_name))
+        # Python < 3.11 has no `co_positions`
+        positions = tuple(code.co_positions()) if hasattr(code, "co_positions") else ()
+        info = _CodeInfo(_qualname(code), source, skipped, positions)
+        self._info[key] = (weakref.ref(code, lambda ref: self._forget(key, ref)), info)
+        return info
+
+    def format(self, frame_id, frame, lineno):
+        """The `StackFrame` of `frame` stopped at line `lineno`, under id `frame_id`."""
+        code = frame.f_code
+        info = self._code_info(code, frame)
+        # Frames of the history have no last instruction
+        lasti = getattr(frame, "f_lasti", -1)
+        try:
+            template = info.templates[lasti, lineno]
+        except KeyError:
+            template = info.templates[lasti, lineno] = self._template(code, info, lasti, lineno)
+        stack_frame = template.copy()
+        stack_frame["id"] = frame_id
+        return stack_frame
+
+    @staticmethod
+    def _template(code, info, lasti, lineno):
+        template = {"name": info.name, "line": lineno, "column": 1, "source": info.source}
+        if info.skipped:
+            template["presentationHint"] = "subtle"
+        index = lasti // 2
+        positions = info.positions
+        if 0 <= index < len(positions):
+            line, end_line, column, end_column = positions[index]
+            if line == lineno and (index == 0 or positions[index - 1][0] != line):
+                # Stopped on a new line, show where its statement starts
+                try:
+                    template["column"] = info.starts[line]
+                except KeyError:
+                    text = linecache.getline(code.co_filename, line)
+                    template["column"] = info.starts[line] = len(text) - len(text.lstrip()) + 1
+            elif line == lineno and column is not None:
+                # Inside a line, in a call, show the range of the expression
+                template["column"] = column + 1
+                if end_line is not None and end_column is not None:
+                    template["endLine"] = end_line
+                    template["endColumn"] = end_column + 1
+        return template
@@ -0,0 +1,164 @@
+import sys
+import threading
+import types
+
+
+def _qualname(code):
+    # co_qualname only exists as of Python 3.11
+    return getattr(code, "co_qualname", code.co_name)
+
+
+class FunctionIndex:
+    """
+    Index of the code objects of loaded modules by qualified name.
+
+    Modules are indexed once, the first time they are seen: the index keeps track of
+    which entries of `sys.modules` it already covers, and :meth:`update` only walks the
+    new ones. Functions are found through the module namespace and the classes defined
+    in it, and nested functions through the constants of their parent's code.
+    """
+
+    def __init__(self):
+        self._modules = {}
+        self._qualnames = {}
+
+    def update(self):
+        """Index the modules imported since the last update."""
+        for name, module in list(sys.modules.items()):
+            if name not in self._modules and isinstance(module, types.ModuleType):
+                self.add(module)
+
+    def add(self, module):
+        """Index `module`, replacing what was indexed under its name before."""
+        name = module.__name__
+        codes = {}
+        seen = set()
+        for value in list(vars(module).values()):
+            self._collect(value, name, codes, seen)
+        self._modules[name] = codes
+        for qualname, code in codes.items():
+            entries = self._qualnames.setdefault(qualname, {})
+            entries[name] = code
+
+    def _collect(self, value, module_name, codes, seen):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        if isinstance(value, (staticmethod, classmethod)):
+            value = value.__func__
+        elif isinstance(value, property):
+            for accessor in (value.fget, value.fset, value.fdel):
+                if accessor is not None:
+                    self._collect(accessor, module_name, codes, seen)
+            return
+        if isinstance(value, types.FunctionType):
+            if value.__module__ != module_name:
+                return
+            while hasattr(value, "__wrapped__") and isinstance(
+                value.__wrapped__, types.FunctionType
+            ):
+                value = value.__wrapped__
+            self._collect_code(value.__code__, value.__qualname__, codes)
+        elif isinstance(value, type) and value.__module__ == module_name:
+            for member in list(vars(value).values()):
+                self._collect(member, module_name, codes, seen)
+
+    def _collect_code(self, code, qualname, codes):
+        codes.setdefault(qualname, code)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                self._collect_code(const, _qualname(const), codes)
+
+    def resolve(self, name):
+        """
+        Find the code object for a function breakpoint.
+
+        `name` is ``module:qualname``, a dotted ``module.qualname``, or a bare qualname.
+        Returns a `(module_name, code)` pair, where `code` is None if the name refers to a
+        module that is not loaded yet. Returns None if the name cannot be found at all.
+        """
+        self.update()
+        if ":" in name:
+            module_name, _, qualname = name.partition(":")
+            codes = self._modules.get(module_name)
+            if codes is None:
+                return module_name, None
+            code = codes.get(qualname)
+            return None if code is None else (module_name, code)
+        entries = self._qualnames.get(name)
+        if entries:
+            module_name = next(iter(entries))
+            return module_name, entries[module_name]
+        parts = name.split(".")
+        for i in range(len(parts) - 1, 0, -1):
+            module_name, qualname = ".".join(parts[:i]), ".".join(parts[i:])
+            codes = self._modules.get(module_name)
+            if codes is not None:
+                code = codes.get(qualname)
+                return None if code is None else (module_name, code)
+        if len(parts) > 1:
+            # Presumably a module that is not imported yet
+            return ".".join(parts[:-1]), None
+        return None
+
+
+class ImportWatcher:
+    """
+    A `sys.meta_path` finder that reports each module once it has been executed.
+
+    It does not find modules itself: it asks the other finders, and wraps the
+    `exec_module` of the loader instance they return. It is only installed while
+    someone is waiting for a module, so imports cost nothing extra otherwise.
+
+    Parameters
+    ----------
+    callback : callable
+        Called with the module, in the importing thread, after its code ran.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._local = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if getattr(self._local, "busy", False):
+            return None
+        self._local.busy = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.busy = False
+        loader = spec.loader
+        # Loaders that are classes, like those of builtin and frozen modules, are shared
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        exec_module = loader.exec_module
+        callback = self.callback
+
+        def exec_and_report(module):
+            try:
+                exec_module(module)
+            finally:
+                del loader.exec_module
+            callback(module)
+
+        try:
+            loader.exec_module = exec_and_report
+        except AttributeError:
+            pass  # the loader does not allow it, the module is picked up on the next update
+        return spec
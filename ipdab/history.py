@@ -0,0 +1,171 @@
+import array
+
+from .watches import bounded_repr
+
+# Separators of the encoded locals, control characters that the repr of a string escapes
+_FIELD = "\x1e"
+_RECORD = "\x1f"
+
+#: Fixed cost of an event in bytes: two 32-bit and one 64-bit array item, and a list slot
+_EVENT_SIZE = 2 * 4 + 8 + 8
+
+# Immutable values, whose bounded repr is cheap and cannot go stale
+_SCALARS = frozenset((int, float, complex, bool, str, bytes, type(None)))
+_CONTAINERS = frozenset((list, tuple, dict, set, frozenset, bytearray))
+
+
+class RecordedValue(str):
+    """The repr of a value as it was recorded, which is also its own repr."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return str(self)
+
+
+class HistoryFrame:
+    """
+    Read-only stand-in for a frame at a recorded line event.
+
+    It has just enough of the frame interface for the stack trace and variables
+    requests. Its locals are the recorded reprs, and it has no globals.
+    """
+
+    def __init__(self, code, lineno, f_locals):
+        self.f_code = code
+        self.f_lineno = lineno
+        self.f_locals = f_locals
+        self.f_globals = {}
+        self.f_back = None
+
+
+class History:
+    """
+    A ring buffer of the line events in user code, to step back through.
+
+    Events are stored column-wise in preallocated arrays: an index into a table of code
+    objects, the line number, the thread ident, and the locals of the frame encoded as
+    one string. Once the buffer is full, or the encoded locals exceed the memory limit,
+    the oldest events are dropped.
+
+    Recording runs on every line, so only scalars are recorded by their bounded repr.
+    Other values are recorded by their type and id, and containers by their length,
+    which costs the same however large they are, and never calls a `__repr__`.
+    Only code objects are kept alive, never frames or the values of variables.
+
+    Parameters
+    ----------
+    capacity : int
+        The maximum number of events.
+    memory_limit : int
+        Approximate maximum number of bytes used by the events.
+    """
+
+    def __init__(self, capacity=10_000, memory_limit=16 * 2**20):
+        self.enabled = False
+        self.repr = bounded_repr(maxstring=60, maxother=60)
+        self.max_locals = 20
+        self.configure(capacity, memory_limit)
+
+    def __bool__(self):
+        return self.enabled
+
+    def __len__(self):
+        return self._count
+
+    def configure(self, capacity=None, memory_limit=None):
+        """Change the limits, which forgets all events recorded so far."""
+        if capacity is not None:
+            self.capacity = capacity
+        if memory_limit is not None:
+            self.memory_limit = memory_limit
+        self._codes = []
+        self._code_index = {}
+        self._code_ids = array.array("I", bytes(4 * self.capacity))
+        self._lines = array.array("I", bytes(4 * self.capacity))
+        self._threads = array.array("Q", bytes(8 * self.capacity))
+        self._locals = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+        self._bytes = 0
+
+    def _encode(self, f_locals):
+        r = self.repr.repr
+        items = []
+        for name, value in list(f_locals.items())[: self.max_locals]:
+            kind = type(value)
+            if kind in _SCALARS:
+                try:
+                    items.append(f"{name}{_FIELD}{r(value)}")
+                except ValueError:
+                    # E.g. an int beyond the limit of digits of `int` to `str` conversion
+                    items.append(f"{name}{_FIELD}<unrepresentable>")
+            elif kind in _CONTAINERS:
+                items.append(
+                    f"{name}{_FIELD}<{kind.__name__} of {len(value)} items at {id(value):#x}>"
+                )
+            else:
+                items.append(f"{name}{_FIELD}<{kind.__qualname__} object at {id(value):#x}>")
+        return _RECORD.join(items)
+
+    def record(self, frame, ident):
+        """Append the line event of `frame`, in the thread with ident `ident`."""
+        code = frame.f_code
+        try:
+            code_id = self._code_index[code]
+        except KeyError:
+            code_id = self._code_index[code] = len(self._codes)
+            self._codes.append(code)
+        encoded = self._encode(frame.f_locals)
+        size = _EVENT_SIZE + len(encoded)
+        while self._count and (
+            self._count == self.capacity or self._bytes + size > self.memory_limit
+        ):
+            self._drop_oldest()
+        slot = (self._start + self._count) % self.capacity
+        self._code_ids[slot] = code_id
+        self._lines[slot] = frame.f_lineno
+        self._threads[slot] = ident
+        self._locals[slot] = encoded
+        self._count += 1
+        self._bytes += size
+
+    def _drop_oldest(self):
+        self._bytes -= _EVENT_SIZE + len(self._locals[self._start])
+        self._locals[self._start] = None
+        self._start = (self._start + 1) % self.capacity
+        self._count -= 1
+
+    def thread(self, position):
+        """The thread ident of event `position`, 0 being the oldest event."""
+        return self._threads[(self._start + position) % self.capacity]
+
+    def location(self, position):
+        """The `(code, lineno)` of event `position`."""
+        slot = (self._start + position) % self.capacity
+        return self._codes[self._code_ids[slot]], self._lines[slot]
+
+    def frame(self, position):
+        """A :class:`HistoryFrame` for event `position`."""
+        code, lineno = self.location(position)
+        encoded = self._locals[(self._start + position) % self.capacity]
+        f_locals = {}
+        if encoded:
+            for item in encoded.split(_RECORD):
+                name, _, value = item.partition(_FIELD)
+                f_locals[name] = RecordedValue(value)
+        return HistoryFrame(code, lineno, f_locals)
+
+    def previous(self, position, ident):
+        """The position of the event before `position` in thread `ident`, or None."""
+        for p in range(position - 1, -1, -1):
+            if self.thread(p) == ident:
+                return p
+        return None
+
+    def next(self, position, ident):
+        """The position of the event after `position` in thread `ident`, or None."""
+        for p in range(position + 1, self._count):
+            if self.thread(p) == ident:
+                return p
+        return None
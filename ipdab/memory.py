@@ -0,0 +1,46 @@
+import base64
+
+#: Buffers up to this size are shown with their repr, larger ones with a summary
+MAX_REPR_SIZE = 4096
+
+
+def buffer_size(value):
+    """
+    The size in bytes of `value` if it exposes a C-contiguous buffer, like `bytes`,
+    `bytearray`, `memoryview`, `array.array` or a C-contiguous NumPy array, or None.
+
+    Fortran-ordered buffers are left out, as their view cannot be cast to bytes without
+    copying the whole buffer.
+    """
+    try:
+        with memoryview(value) as view:
+            return view.nbytes if view.c_contiguous else None
+    except (TypeError, ValueError):
+        return None
+
+
+def summary(value, size):
+    """A short description of the buffer of `value`, in place of its repr."""
+    return f"<{type(value).__name__} of {size} bytes>"
+
+
+def read(value, offset, count):
+    """
+    Read `count` bytes at `offset` of the buffer of `value`.
+
+    Returns the DAP `readMemory` response body. Bytes outside the buffer, with a negative
+    `offset` or past its end, are unreadable. Only the bytes read are copied, from a
+    slice of a `memoryview` of the buffer, which is released right away so the program
+    can resize it again.
+    """
+    with memoryview(value) as view, view.cast("B") as data:
+        start = max(offset, 0)
+        stop = min(max(offset + count, 0), len(data))
+        with data[start:stop] as page:
+            encoded = base64.b64encode(page).decode("ascii")
+            n = len(page)
+    return {
+        "address": f"0x{start:x}",
+        "unreadableBytes": count - n,
+        "data": encoded,
+    }
@@ -0,0 +1,145 @@
+import json
+import math
+import threading
+
+
+class Histogram:
+    """
+    A latency histogram with logarithmic buckets, so its size does not grow with the
+    number of observations.
+
+    Bucket `i` counts observations in ``[2**(i-1), 2**i)`` microseconds, which bounds the
+    error of the reported percentiles to a factor of two.
+    """
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * 40
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        micros = seconds * 1e6
+        index = 0 if micros < 1 else min(int(math.log2(micros)) + 1, len(self.buckets) - 1)
+        self.buckets[index] += 1
+
+    def percentile(self, q):
+        """The upper bound of the bucket holding the `q`-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(2**index / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms of the adapter and the debugger.
+
+    Names are dotted, e.g. ``"command.stackTrace"`` or ``"trace.line"``. Probes are
+    callables that are only evaluated when a report is made, for figures that are kept
+    elsewhere anyway, like the cache statistics of the :class:`~ipdab.debugger.SkipMatcher`.
+
+    Code on hot paths checks the truth value of its metrics first, which is False for
+    :data:`NULL_METRICS`, so disabled instrumentation costs one attribute lookup.
+
+    The adapter and the program write metrics from their own threads, so writes and
+    reports take a lock.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.probes = {}
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return True
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        """Record the current `value` of `name`, and keep track of its maximum."""
+        with self._lock:
+            current, peak = self.gauges.get(name, (0, value))
+            self.gauges[name] = (value, max(peak, value))
+
+    def observe(self, name, seconds):
+        with self._lock:
+            try:
+                histogram = self.histograms[name]
+            except KeyError:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def probe(self, name, func):
+        with self._lock:
+            self.probes[name] = func
+
+    def report(self):
+        """All metrics as a JSON serialisable dict, latencies in seconds."""
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = {k: {"current": v, "max": m} for k, (v, m) in self.gauges.items()}
+            latencies = {k: h.summary() for k, h in self.histograms.items()}
+            probes = dict(self.probes)
+        # Probes read state kept elsewhere, outside of the lock
+        return {
+            "enabled": True,
+            "counters": counters,
+            "gauges": gauges,
+            "latencies": latencies,
+            "probes": {k: func() for k, func in probes.items()},
+        }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class _NullMetrics:
+    """Stand-in for :class:`Metrics` when instrumentation is disabled."""
+
+    def __bool__(self):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def probe(self, name, func):
+        pass
+
+    def report(self):
+        return {"enabled": False}
+
+
+NULL_METRICS = _NullMetrics()
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+
+
+class ModuleIndex:
+    """
+    The modules loaded in the debuggee, kept up to date incrementally.
+
+    Every :meth:`update` diffs the names in `sys.modules` against the names seen so far,
+    which is a set operation on the keys, and only describes the modules that were added.
+    Requests for the module list are served from the index, and the differences are what
+    gets pushed to the client as events.
+
+    Parameters
+    ----------
+    is_library : callable
+        Tells whether a module, by name, is library code rather than user code. The
+        debugger passes its :class:`~ipdab.debugger.SkipMatcher`, so modules the debugger
+        steps into are the user code.
+    """
+
+    def __init__(self, is_library):
+        self.is_library = is_library
+        self._modules = {}
+        # Updated at stops, and on requests of the client from the adapter thread
+        self._lock = threading.Lock()
+
+    def update(self):
+        """
+        Index the modules imported since the last update, and forget those that were
+        removed from `sys.modules`. Returns the added and the removed modules, as DAP
+        `Module` objects.
+        """
+        current = sys.modules.copy()
+        with self._lock:
+            known = self._modules.keys()
+            added = []
+            for name in sorted(current.keys() - known):
+                # None for cached failed imports, which are remembered but not described
+                module = self._modules[name] = self._describe(name, current[name])
+                if module is not None:
+                    added.append(module)
+            removed = [self._modules.pop(name) for name in known - current.keys()]
+        return added, [module for module in removed if module is not None]
+
+    def _describe(self, name, module):
+        if module is None:
+            return None
+        described = {"id": name, "name": name, "isUserCode": not self.is_library(name)}
+        path = getattr(module, "__file__", None)
+        if isinstance(path, str):
+            described["path"] = path
+        return described
+
+    def modules(self, start=0, count=None):
+        """
+        A page of the indexed modules, in the order they were first seen, together with
+        the total number of modules.
+        """
+        modules = [module for module in list(self._modules.values()) if module is not None]
+        stop = None if not count else start + count
+        return modules[start:stop], len(modules)
+
+    def sources(self):
+        """The DAP `Source` of every indexed module that has a source file."""
+        return [
+            source(module)
+            for module in list(self._modules.values())
+            if module is not None and has_source(module)
+        ]
+
+
+def has_source(module):
+    """Whether the described `module` was loaded from a Python source file."""
+    return module.get("path", "").endswith(".py")
+
+
+def source(module):
+    """The DAP `Source` of the described `module`."""
+    return {"name": os.path.basename(module["path"]), "path": module["path"]}
@@ -0,0 +1,165 @@
+import logging
+import os
+import sys
+import threading
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Tee:
+    """A text stream that writes through to `stream`, and to the `capture` as well."""
+
+    def __init__(self, stream, capture, category):
+        self._stream = stream
+        self._capture = capture
+        self._category = category
+
+    def write(self, text):
+        n = self._stream.write(text)
+        self._capture.append(self._category, text)
+        return n
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _LogHandler(logging.Handler):
+    """Appends the log records of the program, not those of ipdab, to the capture."""
+
+    def __init__(self, capture):
+        super().__init__()
+        self._capture = capture
+        self.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    def emit(self, record):
+        if record.pathname.startswith(_PACKAGE_DIR):
+            return
+        try:
+            self._capture.append("console", self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+class OutputCapture:
+    """
+    Tees the output of the program into a buffer, to be forwarded as DAP output events.
+
+    Writes to `sys.stdout` and `sys.stderr`, and optionally log records of the root
+    logger, still go to where they went, and are appended to a buffer in the writing
+    thread, which takes a lock and a list append. The adapter loop takes the buffer
+    every `interval` seconds, or as soon as it holds `flush_size` characters, and sends
+    it as one event per category.
+
+    Writes of a thread in which the debugger prompts are not captured, as they are the
+    prompt and the output of the debugger, rather than of the program, see :meth:`pause`.
+
+    The buffer holds at most `limit` characters. When the program writes faster than
+    the client reads, the writes are dropped from the point the buffer is full until it is
+    taken, and only the number of dropped characters is kept, for the adapter to report.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between flushes.
+    flush_size : int
+        Number of buffered characters that triggers a flush before the interval is up.
+    limit : int
+        Maximum number of buffered characters.
+    """
+
+    def __init__(self, interval=0.05, flush_size=64 * 1024, limit=1024 * 1024):
+        self.interval = interval
+        self.flush_size = flush_size
+        self.limit = limit
+        # Called, from any thread, when the buffer reaches `flush_size`
+        self.wakeup = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._size = 0
+        # Characters dropped since the buffer was taken
+        self._dropped = 0
+        self._woken = False
+        # Idents of the threads whose writes are not captured
+        self._paused = set()
+        self._streams = None
+        self._handler = None
+
+    def __bool__(self):
+        return self.enabled
+
+    def start(self, logs=False):
+        """Start teeing `sys.stdout` and `sys.stderr`, and the root logger if `logs`."""
+        if not self.enabled:
+            self._streams = (sys.stdout, sys.stderr)
+            sys.stdout = _Tee(sys.stdout, self, "stdout")
+            sys.stderr = _Tee(sys.stderr, self, "stderr")
+            self.enabled = True
+        if logs and self._handler is None:
+            self._handler = _LogHandler(self)
+            logging.getLogger().addHandler(self._handler)
+        elif not logs and self._handler is not None:
+            logging.getLogger().removeHandler(self._handler)
+            self._handler = None
+
+    def stop(self):
+        """Restore the streams and the root logger, and forget the buffered output."""
+        if self._handler is not None:
+            logging.getLogger().removeHandler(self._handler)
+            self._handler = None
+        if self.enabled:
+            # Streams replaced after ours, e.g. by `contextlib.redirect_stdout`, are kept
+            if isinstance(sys.stdout, _Tee) and sys.stdout._capture is self:
+                sys.stdout = self._streams[0]
+            if isinstance(sys.stderr, _Tee) and sys.stderr._capture is self:
+                sys.stderr = self._streams[1]
+            self._streams = None
+            self.enabled = False
+        self.take()
+
+    def pause(self):
+        """Stop capturing the writes of the current thread, until :meth:`resume`."""
+        self._paused.add(threading.get_ident())
+
+    def resume(self):
+        """Capture the writes of the current thread again."""
+        self._paused.discard(threading.get_ident())
+
+    def append(self, category, text):
+        if not text or (self._paused and threading.get_ident() in self._paused):
+            return
+        with self._lock:
+            # Once full, drop everything until the buffer is taken, so no partial lines
+            if self._dropped or self._size + len(text) > self.limit:
+                self._dropped += len(text)
+                return
+            self._chunks.append((category, text))
+            self._size += len(text)
+            wakeup = self._size >= self.flush_size and not self._woken
+            if wakeup:
+                self._woken = True
+        if wakeup and self.wakeup is not None:
+            self.wakeup()
+
+    def take(self):
+        """
+        Empty the buffer. Returns the buffered output as `(category, text)` pairs, with
+        consecutive writes of the same category joined, and the number of dropped
+        characters.
+        """
+        with self._lock:
+            chunks, dropped = self._chunks, self._dropped
+            self._chunks = []
+            self._size = self._dropped = 0
+            self._woken = False
+        joined = []
+        for category, text in chunks:
+            if joined and joined[-1][0] == category:
+                joined[-1][1].append(text)
+            else:
+                joined.append((category, [text]))
+        return [(category, "".join(texts)) for category, texts in joined], dropped
@@ -0,0 +1,151 @@
+import bdb
+import cProfile
+import os
+import pdb
+import pstats
+import sys
+import threading
+import time
+
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_DEBUGGER_FILES = {os.path.abspath(bdb.__file__), os.path.abspath(pdb.__file__)}
+
+
+def _is_debugger(key):
+    """Whether the profiled function `key` is part of the debugger rather than the program."""
+    filename = key[0]
+    if filename == "~":
+        return False
+    path = os.path.abspath(filename)
+    return (
+        path.startswith(_PACKAGE_DIR)
+        or path in _DEBUGGER_FILES
+        or (
+            # The debuggers of IPython, which `ipdb` runs on
+            os.path.basename(path) == "debugger.py" and f"{os.sep}IPython{os.sep}" in path
+        )
+    )
+
+
+def _function_name(key):
+    filename, lineno, name = key
+    if filename == "~":
+        # Builtins, e.g. "<built-in method time.sleep>"
+        return name
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+class StopProfiler:
+    """
+    Profiles the program between a `continue` (or `until`) and the next stop.
+
+    `cProfile` only sees the thread that continued, and nothing of the debugger itself:
+    the debugger runs inside the trace function, for which the interpreter suspends
+    profiling. So the report covers exactly the code that ran since the user continued.
+
+    Disabled by default, since even `cProfile` slows the program down noticeably.
+
+    Parameters
+    ----------
+    top : int
+        The number of functions to report.
+    """
+
+    def __init__(self, top=20):
+        self.enabled = False
+        self.top = top
+        self._profile = None
+        self._ident = None
+        self._wall = self._cpu = 0.0
+
+    def __bool__(self):
+        return self.enabled
+
+    def start(self):
+        """Start profiling the current thread, unless already profiling."""
+        if not self.enabled or self._profile is not None or sys.getprofile() is not None:
+            return
+        self._profile = cProfile.Profile()
+        self._ident = threading.get_ident()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._profile.enable()
+
+    def stop(self):
+        """
+        Stop profiling and return the report, or None if the current thread is not
+        being profiled, e.g., because another thread hit a breakpoint.
+        """
+        if self._profile is None or threading.get_ident() != self._ident:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        return self.report(pstats.Stats(profile).stats, wall, cpu)
+
+    def cancel(self):
+        """
+        Stop profiling without a report, when no stop is coming to end the profile, e.g.,
+        because the debugger no longer traces the program. Only the profiled thread can
+        stop its profile.
+        """
+        if self._profile is not None and threading.get_ident() == self._ident:
+            profile, self._profile = self._profile, None
+            profile.disable()
+
+    def report(self, stats, wall, cpu):
+        """
+        Summarise `pstats` data into a dict with the `wallTime` and `cpuTime` since the
+        continue, in seconds, and the `top` functions by own time. Each function lists
+        its `calls`, own and cumulative time, and its callers by cumulative time.
+
+        The functions of ipdab, `bdb` and `pdb`, e.g., the debugger entering its prompt,
+        are left out, and so are builtins only they call.
+        """
+        entries = []
+        for key, entry in stats.items():
+            callers = entry[4]
+            if _is_debugger(key):
+                continue
+            if key[0] == "~" and callers and all(_is_debugger(c) for c in callers):
+                continue
+            callers = {c: v for c, v in callers.items() if not _is_debugger(c)}
+            entries.append((key, (*entry[:4], callers)))
+        entries.sort(key=lambda item: item[1][2], reverse=True)
+        functions = []
+        for key, (_, ncalls, tottime, cumtime, callers) in entries[: self.top]:
+            filename, lineno, _ = key
+            functions.append(
+                {
+                    "name": _function_name(key),
+                    "path": None if filename == "~" else filename,
+                    "line": lineno,
+                    "calls": ncalls,
+                    "ownTime": tottime,
+                    "cumulativeTime": cumtime,
+                    "callers": [
+                        {"name": _function_name(caller), "calls": c[1], "cumulativeTime": c[3]}
+                        for caller, c in sorted(
+                            callers.items(), key=lambda item: item[1][3], reverse=True
+                        )[:3]
+                    ],
+                }
+            )
+        return {"wallTime": wall, "cpuTime": cpu, "functions": functions}
+
+    @staticmethod
+    def format(report):
+        """Render a report as a table for the debug console."""
+        lines = [
+            f"Since continue: {report['wallTime']:.3f}s wall, {report['cpuTime']:.3f}s CPU",
+            f"{'calls':>9} {'own s':>9} {'cum s':>9}  function",
+        ]
+        for f in report["functions"]:
+            lines.append(
+                f"{f['calls']:>9} {f['ownTime']:>9.4f} {f['cumulativeTime']:>9.4f}  {f['name']}"
+            )
+            for caller in f["callers"]:
+                lines.append(f"{'':>31}<- {caller['name']} ({caller['calls']} calls)")
+        return "\n".join(lines) + "\n"
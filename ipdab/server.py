@@ -1,12 +1,26 @@
 import asyncio
 import atexit
+import concurrent.futures
 import inspect
 import json
 import logging
+import os
+import re
+import signal
+import sys
 import threading
 import time
+import traceback
 
-from .debugger import Debugger
+from .debugger import ASYNCIO_SKIP, Debugger
+from .frames import FrameFormatter
+from .history import HistoryFrame
+from .modules import has_source, source
+from .memory import MAX_REPR_SIZE, buffer_size, read, summary
+from .metrics import NULL_METRICS, Metrics
+from .output import OutputCapture
+from .snapshot import ADAPTER_THREAD_NAME, dap_thread_id, live_threads, thread_stacks
+from .sources import SourceRegistry
 
 
 class IPDBAdapterServer:
@@ -54,6 +68,10 @@ class IPDBAdapterServer:
     if it is not already running,
     """
 
+    #: Number of asyncio tasks listed with the threads, the rest is paged in with the
+    #: custom `ipdab/tasks` request.
+    task_page_size = 100
+
     def __init__(
         self, host="localhost", port=9000, debugger="ipdb", on_continue="exit_without_breakpoint"
     ):
@@ -66,14 +84,42 @@ class IPDBAdapterServer:
         self.thread = None
         self.runner = None
         self.on_continue = on_continue
+        self.async_tasks = False
         self.debugger = Debugger(
             backend=debugger,
             stopped_callback=self.stopped_callback,
             exited_callback=self.exited_callback,
             on_continue_callback=lambda: self.on_continue,
+            breakpoint_callback=self.breakpoint_callback,
+            resumed_callback=self.resumed_callback,
         )
         self.client_writer = None
         self.client_reader = None
+        # Arguments of the `initialize` request, telling which features the client has
+        self.client_capabilities = {}
+        # Body of the `stopped` event of the current stop, None while the program runs
+        self.stopped_body = None
+        # Module and source events are only sent once the client listed them
+        self.modules_listed = self.sources_listed = False
+        # Complete in the debug console with IPython's completer, on the ipdb backend
+        self.ipython_completions = False
+        # Output of the program, forwarded as output events by `forward_output`
+        self.output = self.debugger.output = OutputCapture()
+        self._output_task = None
+        self.metrics = NULL_METRICS
+        # Dump the metrics as JSON to this path at exit
+        self.metrics_path = None
+        # Sources without a file, like IPython cells, served by reference
+        self.sources = SourceRegistry()
+        # Metadata of the code of frames in stack traces, by code object
+        self.frames = FrameFormatter(
+            lambda module_name: self.debugger.debugger.is_skipped_module(module_name),
+            self.sources,
+        )
+        # Keep the server when the debugger quits, for the lifetime of an IPython kernel
+        self.keep_alive = False
+        # Set once a client finished its configuration, see `run`
+        self.configured = threading.Event()
         # Prevent call the shutdown function twice
         self._shutdown_event = threading.Event()
         self._exited_event = threading.Event()
@@ -123,17 +169,38 @@ class IPDBAdapterServer:
             if line.lower().startswith("content-length:"):
                 content_length = int(line.split(":")[1].strip())
         body = await reader.read(content_length)
+        if self.metrics:
+            self.metrics.count("bytes.in", len(header) + len(body))
         return json.loads(body.decode())
 
     def encode_dap_message(self, payload):
         body = json.dumps(payload)
-        return f"Content-Length: {len(body)}\r\n\r\n{body}".encode()
+        message = f"Content-Length: {len(body)}\r\n\r\n{body}".encode()
+        if self.metrics:
+            self.metrics.count("bytes.out", len(message))
+        return message
+
+    def enable_metrics(self, path=None):
+        """
+        Start recording metrics, see :mod:`ipdab.metrics`. They can be queried with the
+        custom `ipdab/metrics` request, and are written to `path` as JSON at exit.
+        """
+        if not self.metrics:
+            self.metrics = Metrics()
+            self.debugger.instrument(self.metrics)
+        self.metrics_path = path
 
     async def send_event(self, event_body):
         event_msg = {"type": "event", "seq": 0, **event_body}
         self.client_writer.write(self.encode_dap_message(event_msg))
         await self.client_writer.drain()
 
+    async def send_output(self, output, category="console"):
+        if self.client_connected:
+            await self.send_event(
+                {"event": "output", "body": {"category": category, "output": output}}
+            )
+
     @property
     def client_connected(self):
         return self.client_writer is not None and self.client_reader is not None
@@ -151,31 +218,136 @@ class IPDBAdapterServer:
             logging.error(f"[IPDB Server] {msg}")
             raise RuntimeError(msg)
 
-    def stopped_callback(self, reason="breakpoint"):
-        in_thread = "in thread" if threading.current_thread() == self.thread else "in main thread"
-        function_name = inspect.currentframe().f_code.co_name
+    def stopped_callback(self, reason="breakpoint", thread_id=1):
         if self._shutdown_event.is_set():
             return
         elif self.server_running:
             asyncio.run_coroutine_threadsafe(
-                self.notify_stopped(reason=reason), self.runner._loop
+                self.notify_stopped(reason=reason, thread_id=thread_id), self.runner._loop
             ).result()
-        else:
-            msg = f"[IPDB Server {function_name} {in_thread}] Server is not running, skipping stopped notification."
+        elif logging.getLogger().isEnabledFor(logging.DEBUG):
+            in_thread = (
+                "in thread" if threading.current_thread() == self.thread else "in main thread"
+            )
+            msg = f"[IPDB Server stopped_callback {in_thread}] Server is not running, skipping stopped notification."
             logging.debug(msg)
 
-    async def notify_stopped(self, reason="breakpoint"):
+    async def notify_stopped(self, reason="breakpoint", thread_id=1):
+        # Only the stopping thread is stopped, the other threads of the program run on
+        body = {"reason": reason, "threadId": thread_id, "allThreadsStopped": False}
+        exception = self.debugger.exception
+        if reason == "exception" and exception is not None:
+            body["description"] = "Paused on exception"
+            body["text"] = traceback.format_exception_only(exception)[-1].strip()
+        elif self.debugger.stop_text is not None:
+            body["text"] = self.debugger.stop_text
+        # Kept for clients that connect during the stop, see `replay_stop`
+        self.stopped_body = body
+        if self.client_connected:
+            if self.output:
+                # Show the output written before the stop before the stop itself
+                await self.flush_output()
+            await self.send_event({"event": "stopped", "body": body})
+            snapshot = self.debugger.snapshot
+            if self.metrics and snapshot is not None:
+                self.metrics.observe("stop.to_event", time.perf_counter() - snapshot.time)
+            if snapshot is not None:
+                await self.notify_watches(snapshot)
+                await self.notify_modules(*snapshot.modules)
+            if snapshot is not None and snapshot.profile is not None:
+                await self.send_event(
+                    {
+                        "event": "ipdab/profile",
+                        "body": {"threadId": thread_id, **snapshot.profile},
+                    }
+                )
+                await self.send_output(self.debugger.profiler.format(snapshot.profile))
+
+    async def notify_watches(self, snapshot):
+        if snapshot.watches is not None:
+            await self.send_event(
+                {
+                    "event": "ipdab/watches",
+                    "body": {"threadId": snapshot.thread_id, "watches": snapshot.watches},
+                }
+            )
+
+    async def replay_stop(self):
+        """
+        Bring a client that connected while the program is stopped up to date, with the
+        `stopped` event of the current stop, and its watches. Everything else the client
+        asks for is served from the snapshot of the stop, as for any client.
+        """
+        snapshot = self.debugger.snapshot
+        if snapshot is None:
+            return
+        body = self.stopped_body
+        if body is None:
+            body = {"reason": "entry", "threadId": snapshot.thread_id, "allThreadsStopped": False}
+        await self.send_event({"event": "stopped", "body": body})
+        await self.notify_watches(snapshot)
+
+    def resumed_callback(self, thread_id=1):
+        """
+        Notify the client that the program runs again, and that everything it fetched at
+        the stop is stale: frame ids and variable references are no longer valid.
+        This method is called from the debugger, in the thread that was stopped.
+        """
+        if self._shutdown_event.is_set() or self._exited_event.is_set() or not self.server_running:
+            return
+        asyncio.run_coroutine_threadsafe(
+            self.notify_resumed(thread_id), self.runner._loop
+        ).result()
+
+    async def notify_resumed(self, thread_id=1):
+        self.stopped_body = None
         if self.client_connected:
             await self.send_event(
                 {
-                    "event": "stopped",
-                    "body": {
-                        "reason": reason,
-                        "threadId": 1,
-                        "allThreadsStopped": True,
-                    },
+                    "event": "continued",
+                    "body": {"threadId": thread_id, "allThreadsContinued": True},
                 }
             )
+            if self.client_capabilities.get("supportsInvalidatedEvent"):
+                await self.send_event(
+                    {
+                        "event": "invalidated",
+                        "body": {"areas": ["threads", "stacks", "variables"]},
+                    }
+                )
+
+    async def notify_modules(self, added, removed):
+        """Send the modules and sources that were added or removed since the last stop."""
+        for reason, modules in (("new", added), ("removed", removed)):
+            for module in modules:
+                if self.modules_listed:
+                    await self.send_event(
+                        {"event": "module", "body": {"reason": reason, "module": module}}
+                    )
+                if self.sources_listed and has_source(module):
+                    await self.send_event(
+                        {
+                            "event": "loadedSource",
+                            "body": {"reason": reason, "source": source(module)},
+                        }
+                    )
+
+    def breakpoint_callback(self, bp):
+        """
+        Notify the client that a pending function breakpoint got verified.
+        This method is called from the thread that imported the function's module.
+        """
+        if self._shutdown_event.is_set() or not self.server_running:
+            return
+        asyncio.run_coroutine_threadsafe(
+            self.send_event(
+                {
+                    "event": "breakpoint",
+                    "body": {"reason": "changed", "breakpoint": function_breakpoint(bp)},
+                }
+            ),
+            self.runner._loop,
+        ).result()
 
     def exited_callback(self, reason="exited"):
         """
@@ -187,6 +359,9 @@ class IPDBAdapterServer:
             return
         elif self._exited_event.is_set():
             return
+        elif self.keep_alive:
+            # Quitting the debugger only ends the cell, the next one debugs again
+            self.debugger.clear_exited()
         elif self.server_running:
             asyncio.run_coroutine_threadsafe(
                 self.notify_exited(reason=reason), self.runner._loop
@@ -209,6 +384,8 @@ class IPDBAdapterServer:
             if self._terminated_event.is_set():
                 return
             else:
+                if self.output:
+                    await self.flush_output()
                 await self.send_event(
                     {
                         "event": "exited",
@@ -227,6 +404,8 @@ class IPDBAdapterServer:
         else:
             self._terminated_event.set()
         if self.client_connected:
+            if self.output:
+                await self.flush_output()
             await self.send_event(
                 {
                     "event": "terminated",
@@ -239,13 +418,16 @@ class IPDBAdapterServer:
         in_thread = "in thread" if threading.current_thread() == self.thread else "in main thread"
         if self.client_connected:
             logging.debug(
-                f"[IPDB Server {function_name} {in_thread}] Client already connected, disconnecting old client"
+                "[IPDB Server %s %s] Client already connected, disconnecting old client",
+                function_name,
+                in_thread,
             )
             await self.disconnect_client()
         try:
-            logging.info(f"[IPDB Server {function_name} {in_thread}] New client connection")
+            logging.info("[IPDB Server %s %s] New client connection", function_name, in_thread)
             self.client_reader = reader
             self.client_writer = writer
+            self.modules_listed = self.sources_listed = False
             self.debugger.clear_exited()
             while not self._shutdown_event.is_set():
                 try:
@@ -253,18 +435,23 @@ class IPDBAdapterServer:
                         self.read_dap_message(reader)
                     )
                     msg = await self._read_dap_message_task
+                    received = time.perf_counter()
                     if (
                         self._shutdown_event.is_set()
                         or self._exited_event.is_set()
                         or self._terminated_event.is_set()
                     ):
                         logging.debug(
-                            f"[IPDB Server {function_name} {in_thread}] Shutdown event set, closing client connection"
+                            "[IPDB Server %s %s] Shutdown event set, closing client connection",
+                            function_name,
+                            in_thread,
                         )
                         break
                 except asyncio.CancelledError:
                     logging.debug(
-                        f"[IPDB Server {function_name} {in_thread}] Read message cancelled, closing client connection"
+                        "[IPDB Server %s %s] Read message cancelled, closing client connection",
+                        function_name,
+                        in_thread,
                     )
                     break
                 except Exception as e:
@@ -273,7 +460,9 @@ class IPDBAdapterServer:
                     )
                     break
                 if msg is None:
-                    logging.info(f"[IPDB Server {function_name} {in_thread}] Client disconnected")
+                    logging.info(
+                        "[IPDB Server %s %s] Client disconnected", function_name, in_thread
+                    )
                     break
                 response = {
                     "type": "response",
@@ -284,10 +473,70 @@ class IPDBAdapterServer:
                 }
                 cmd = msg.get("command")
                 if cmd == "initialize":
-                    response["body"] = {"supportsConfigurationDoneRequest": True}
-                elif cmd == "launch":
+                    self.client_capabilities = msg.get("arguments", {})
+                    response["body"] = {
+                        "supportsConfigurationDoneRequest": True,
+                        "supportsExceptionInfoRequest": True,
+                        "supportsDataBreakpoints": True,
+                        "supportsFunctionBreakpoints": True,
+                        "supportsStepBack": True,
+                        "supportsModulesRequest": True,
+                        "supportsLoadedSourcesRequest": True,
+                        "supportsCompletionsRequest": True,
+                        "completionTriggerCharacters": ["."],
+                        "supportsReadMemoryRequest": True,
+                    }
+                elif cmd in ("launch", "attach"):
+                    # The program is running already either way, they only differ for the IDE
                     response["body"] = {}
+                    if "watches" in msg.get("arguments", {}):
+                        self.debugger.watches.set(msg["arguments"]["watches"])
+                    if "profile" in msg.get("arguments", {}):
+                        try:
+                            self.set_profiling(msg["arguments"]["profile"])
+                        except ValueError as e:
+                            response["success"] = False
+                            response["message"] = f"Invalid profile: {e}"
+                    if "record" in msg.get("arguments", {}):
+                        self.set_recording(msg["arguments"]["record"])
+                    if "output" in msg.get("arguments", {}):
+                        self.capture_output(msg["arguments"]["output"])
+                    if "completer" in msg.get("arguments", {}):
+                        self.ipython_completions = msg["arguments"]["completer"] == "ipython"
+                    args = msg.get("arguments", {})
+                    if any(k in args for k in ("justMyCode", "skip", "unskip", "rules")):
+                        try:
+                            self.debugger.configure_skipping(
+                                just_my_code=args.get("justMyCode"),
+                                skip=args.get("skip"),
+                                unskip=args.get("unskip"),
+                                rules=args.get("rules"),
+                            )
+                            self.frames.clear()
+                        except (ValueError, TypeError, re.error) as e:
+                            response["success"] = False
+                            response["message"] = f"Invalid skip configuration: {e}"
                     await self.send_event({"event": "initialized", "body": {}})
+                elif cmd == "continue" and self.debugger.in_history:
+                    self.debugger.go_live()
+                    response["body"] = {"allThreadsContinued": False}
+                    await self.notify_stopped("step", self.debugger.snapshot.thread_id)
+                elif cmd == "next" and self.debugger.in_history:
+                    self.debugger.step_forward()
+                    response["body"] = {}
+                    await self.notify_stopped("step", self.debugger.snapshot.thread_id)
+                elif cmd in ("stepBack", "reverseContinue"):
+                    if self.debugger.snapshot is None or not self.debugger.history:
+                        response["success"] = False
+                        response["message"] = "Not recording, launch with `record`"
+                    else:
+                        reason = self.debugger.step_back(reverse_continue=cmd == "reverseContinue")
+                        if reason is None:
+                            response["success"] = False
+                            response["message"] = "No earlier events recorded"
+                        else:
+                            response["body"] = {}
+                            await self.notify_stopped(reason, self.debugger.snapshot.thread_id)
                 elif cmd == "continue":
                     logging.error(
                         f"[IPDB Server {function_name} {in_thread}] Continue commands can only be send through terminal"
@@ -320,83 +569,197 @@ class IPDBAdapterServer:
                     response["message"] = "Next commands can only be sent through terminal"
                 elif cmd == "configurationDone":
                     response["body"] = {}
-                    await self.send_event(
-                        {
-                            "event": "stopped",
-                            "body": {"reason": "entry", "threadId": 1, "allThreadsStopped": True},
-                        }
-                    )
+                    self.configured.set()
+                    # Nothing to replay if the client connected while the program runs
+                    await self.replay_stop()
                 elif cmd == "threads":
-                    response["body"] = {"threads": [{"id": 1, "name": "MainThread"}]}
+                    response["body"] = {"threads": self.list_threads()}
+                elif cmd == "ipdab/tasks":
+                    args = msg.get("arguments", {})
+                    snapshot = self.debugger.snapshot
+                    tasks, total = [], 0
+                    if snapshot is not None:
+                        tasks, total = snapshot.tasks(
+                            args.get("start", 0), args.get("count", self.task_page_size)
+                        )
+                    response["body"] = {
+                        "tasks": [{"id": task_id, "name": name} for task_id, name in tasks],
+                        "totalTasks": total,
+                    }
+                elif cmd == "modules":
+                    args = msg.get("arguments", {})
+                    self.debugger.modules.update()
+                    self.modules_listed = True
+                    modules, total = self.debugger.modules.modules(
+                        args.get("startModule", 0), args.get("moduleCount", 0)
+                    )
+                    response["body"] = {"modules": modules, "totalModules": total}
+                elif cmd == "loadedSources":
+                    self.debugger.modules.update()
+                    self.sources_listed = True
+                    response["body"] = {"sources": self.debugger.modules.sources()}
+                elif cmd == "ipdab/setWatches":
+                    self.debugger.watches.set(msg.get("arguments", {}).get("expressions", []))
+                    response["body"] = {}
+                elif cmd == "ipdab/setProfiling":
+                    try:
+                        self.set_profiling(msg.get("arguments", {}).get("profile", True))
+                    except ValueError as e:
+                        response["success"] = False
+                        response["message"] = f"Invalid profile: {e}"
+                    response["body"] = {}
+                elif cmd == "ipdab/metrics":
+                    response["body"] = self.metrics.report()
+                elif cmd == "ipdab/setRecording":
+                    self.set_recording(msg.get("arguments", {}).get("record", True))
+                    response["body"] = {}
+                elif cmd == "ipdab/dumpThreads":
+                    response["body"] = {
+                        "threads": [
+                            {
+                                "id": thread_id,
+                                "name": name,
+                                "stackFrames": [
+                                    {
+                                        "name": f.f_code.co_name,
+                                        "line": lineno,
+                                        "source": {"path": f.f_code.co_filename},
+                                    }
+                                    for f, lineno in stack
+                                ],
+                            }
+                            for thread_id, name, stack in thread_stacks()
+                        ]
+                    }
                 elif cmd == "stackTrace":
-                    frames = []
-                    if self.debugger.curframe:
-                        f = self.debugger.curframe
-                        i = 0
-                        while f and i < 20:
-                            code = f.f_code
-                            frames.append(
-                                {
-                                    "id": i,
-                                    "name": code.co_name,
-                                    "line": f.f_lineno,
-                                    "column": 1,
-                                    "source": {"path": code.co_filename},
-                                }
-                            )
-                            f = f.f_back
-                            i += 1
-                    response["body"] = {"stackFrames": frames, "totalFrames": len(frames)}
+                    args = msg.get("arguments", {})
+                    frames, total = [], 0
+                    snapshot = self.debugger.snapshot
+                    if snapshot is not None:
+                        thread_id = args.get("threadId", snapshot.thread_id)
+                        # No `levels`, or 0, asks for all frames
+                        page, total = snapshot.stack_page(
+                            thread_id, args.get("startFrame", 0), args.get("levels") or None
+                        )
+                        frames = [self.frames.format(*frame) for frame in page]
+                    response["body"] = {"stackFrames": frames, "totalFrames": total}
                 elif cmd == "scopes":
                     frame_id = msg.get("arguments", {}).get("frameId", 0)
-                    response["body"] = {
-                        "scopes": [
+                    snapshot = self.debugger.snapshot
+                    scopes = []
+                    if snapshot is not None:
+                        scopes = [
                             {
                                 "name": "Locals",
-                                "variablesReference": 1000 + frame_id,
+                                "variablesReference": snapshot.handle(("locals", frame_id)),
                                 "expensive": False,
                             },
                             {
                                 "name": "Globals",
-                                "variablesReference": 2000 + frame_id,
+                                "variablesReference": snapshot.handle(("globals", frame_id)),
                                 "expensive": True,
                             },
                         ]
-                    }
+                    response["body"] = {"scopes": scopes}
                 elif cmd == "variables":
                     var_ref = msg.get("arguments", {}).get("variablesReference", 0)
-                    frame = self.debugger.curframe
+                    snapshot = self.debugger.snapshot
+                    scope = None if snapshot is None else snapshot.resolve(var_ref)
                     variables = []
-                    if 1000 <= var_ref < 2000 and frame:
-                        for k, v in frame.f_locals.items():
-                            variables.append(
-                                {"name": k, "value": repr(v), "variablesReference": 0}
-                            )
-                    elif var_ref >= 2000 and frame:
-                        for k, v in frame.f_globals.items():
-                            variables.append(
-                                {"name": k, "value": repr(v), "variablesReference": 0}
-                            )
+                    if scope is not None:
+                        kind, frame_id = scope
+                        frame = snapshot.frame(frame_id)
+                        if frame is not None:
+                            namespace = frame.f_locals if kind == "locals" else frame.f_globals
+                            metrics = self.metrics
+                            for k, v in namespace.items():
+                                size = buffer_size(v)
+                                if size is not None and size > MAX_REPR_SIZE:
+                                    # The contents are read with `readMemory` instead
+                                    value = summary(v, size)
+                                elif metrics:
+                                    start = time.perf_counter()
+                                    value = repr(v)
+                                    metrics.observe("variables.repr", time.perf_counter() - start)
+                                else:
+                                    value = repr(v)
+                                variable = {"name": k, "value": value, "variablesReference": 0}
+                                if size is not None:
+                                    variable["memoryReference"] = snapshot.memory_reference(v)
+                                variables.append(variable)
                     response["body"] = {"variables": variables}
                 elif cmd == "evaluate":
-                    expr = msg.get("arguments", {}).get("expression", "")
-                    try:
-                        # Evaluate expression in ipdb debugger context
-                        result = eval(
-                            expr, self.debugger.curframe.f_globals, self.debugger.curframe.f_locals
+                    args = msg.get("arguments", {})
+                    expr = args.get("expression", "")
+                    frame = self.debugger.curframe
+                    snapshot = self.debugger.snapshot
+                    if "frameId" in args and snapshot is not None:
+                        frame = snapshot.frame(args["frameId"]) or frame
+                    watched = None
+                    if (
+                        args.get("context") == "watch"
+                        and snapshot is not None
+                        and snapshot.watches is not None
+                        and frame is snapshot.top_frame
+                    ):
+                        watched = next(
+                            (w for w in snapshot.watches if w["expression"] == expr), None
                         )
+                    if watched is not None:
+                        # Evaluated at the stop already, see `WatchRegistry`
+                        response["body"] = {"result": watched["result"], "variablesReference": 0}
+                    elif isinstance(frame, HistoryFrame):
+                        # Nothing can be evaluated in the past, only recorded locals are known
+                        result = frame.f_locals.get(expr, f"Error: {expr} was not recorded")
                         response["body"] = {"result": str(result), "variablesReference": 0}
-                    except Exception as e:
-                        response["body"] = {"result": f"Error: {e}", "variablesReference": 0}
+                    else:
+                        try:
+                            # Evaluate expression in ipdb debugger context
+                            result = eval(expr, frame.f_globals, frame.f_locals)
+                            response["body"] = {"result": str(result), "variablesReference": 0}
+                        except Exception as e:
+                            response["body"] = {"result": f"Error: {e}", "variablesReference": 0}
+                elif cmd == "readMemory":
+                    args = msg.get("arguments", {})
+                    snapshot = self.debugger.snapshot
+                    value = None
+                    if snapshot is not None:
+                        value = snapshot.buffer(args.get("memoryReference"))
+                    if value is None:
+                        response["success"] = False
+                        response["message"] = "Unknown memory reference"
+                    else:
+                        try:
+                            response["body"] = read(
+                                value, args.get("offset", 0), args.get("count", 0)
+                            )
+                        except (TypeError, ValueError) as e:
+                            # E.g., a memoryview released by the program since
+                            response["success"] = False
+                            response["message"] = f"Cannot read memory: {e}"
+                elif cmd == "completions":
+                    response["body"] = {"targets": self.complete(msg.get("arguments", {}))}
+                elif cmd == "exceptionInfo":
+                    exception = self.debugger.exception
+                    if exception is None:
+                        response["success"] = False
+                        response["message"] = "Not stopped on an exception"
+                    else:
+                        details = exception_details(exception)
+                        response["body"] = {
+                            "exceptionId": details["fullTypeName"],
+                            "description": details["message"],
+                            "breakMode": "unhandled",
+                            "details": details,
+                        }
                 elif cmd == "setBreakpoints":
                     args = msg.get("arguments", {})
                     source = args.get("source", {})
-                    path = source.get("path", "")
+                    path = source.get("path") or self.sources.path(source.get("sourceReference"))
+                    path = path or ""
                     breakpoints = args.get("breakpoints", [])
                     # Clear old breakpoints in the file
-                    if path in self.debugger.get_all_breaks():
-                        for bp_line in self.debugger.get_all_breaks()[path]:
-                            self.debugger.clear_break(path, bp_line)
+                    self.debugger.clear_source_breaks(path)
                     actual_bps = []
                     for bp in breakpoints:
                         line = bp.get("line")
@@ -404,14 +767,65 @@ class IPDBAdapterServer:
                             self.debugger.set_break(path, line)
                             actual_bps.append({"verified": True, "line": line})
                     response["body"] = {"breakpoints": actual_bps}
+                elif cmd == "setFunctionBreakpoints":
+                    requested = msg.get("arguments", {}).get("breakpoints", [])
+                    breakpoints = self.debugger.set_function_breakpoints(
+                        [(bp.get("name", ""), bp.get("condition")) for bp in requested]
+                    )
+                    response["body"] = {
+                        "breakpoints": [function_breakpoint(bp) for bp in breakpoints]
+                    }
+                elif cmd == "dataBreakpointInfo":
+                    args = msg.get("arguments", {})
+                    snapshot = self.debugger.snapshot
+                    frame, scope = self.debugger.curframe, None
+                    if snapshot is not None:
+                        if args.get("variablesReference"):
+                            handle = snapshot.resolve(args["variablesReference"])
+                            if handle is not None:
+                                scope, frame_id = handle
+                                frame = snapshot.frame(frame_id)
+                        elif "frameId" in args:
+                            frame = snapshot.frame(args["frameId"]) or frame
+                    if frame is None:
+                        data_id, description = None, "Not stopped"
+                    else:
+                        data_id, description = self.debugger.describe_data(
+                            frame, args.get("name", ""), scope
+                        )
+                    response["body"] = {
+                        "dataId": data_id,
+                        "description": description,
+                        "accessTypes": ["write"],
+                        "canPersist": False,
+                    }
+                elif cmd == "setDataBreakpoints":
+                    requested = msg.get("arguments", {}).get("breakpoints", [])
+                    breakpoints = self.debugger.set_data_breakpoints(
+                        [bp.get("dataId") for bp in requested]
+                    )
+                    response["body"] = {
+                        "breakpoints": [
+                            {"verified": True, "message": bp.description}
+                            if bp is not None
+                            else {"verified": False, "message": "Unknown data id"}
+                            for bp in breakpoints
+                        ]
+                    }
                 elif cmd == "setExceptionBreakpoints":
                     # You can store exception breakpoints info if needed or just acknowledge
                     response["body"] = {}
                     # For now, just acknowledge success; real implementation would configure exception breakpoints in debugger
                 elif cmd == "source":
                     args = msg.get("arguments", {})
+                    reference = args.get("source", {}).get("sourceReference") or args.get(
+                        "sourceReference"
+                    )
+                    content = self.sources.source(reference) if reference else None
+                    if content is not None:
+                        response["body"] = {"content": content}
                     # For simplicity, handle only file path sources (no binary or compiled sources)
-                    if "path" in args.get("source", {}):
+                    elif "path" in args.get("source", {}):
                         path = args["source"]["path"]
                         try:
                             with open(path, "r", encoding="utf-8") as f:
@@ -423,15 +837,25 @@ class IPDBAdapterServer:
                     else:
                         response["success"] = False
                         response["message"] = "Unsupported source reference"
+                elif cmd == "dumpCell":
+                    # As in the Jupyter debug protocol, to set breakpoints in a cell before it runs
+                    path = self.sources.dump(msg.get("arguments", {}).get("code", ""))
+                    if path is None:
+                        response["success"] = False
+                        response["message"] = "Cells are only known with %load_ext ipdab"
+                    else:
+                        response["body"] = {"sourcePath": path}
                 elif cmd == "disassemble":
                     logging.debug(
-                        f"[IPDB Server {function_name} {in_thread}] Disassemble command received"
+                        "[IPDB Server %s %s] Disassemble command received",
+                        function_name,
+                        in_thread,
                     )
                     response["success"] = False
                     response["message"] = "Disassemble not supported in this debugger"
                 elif cmd == "disconnect":
                     logging.info(
-                        f"[IPDB Server {function_name} {in_thread}] Disconnect command recived"
+                        "[IPDB Server %s %s] Disconnect command recived", function_name, in_thread
                     )
                     response["success"] = True
                     response["message"] = "Disconnecting client"
@@ -451,7 +875,13 @@ class IPDBAdapterServer:
                     break
                 else:
                     writer.write(self.encode_dap_message(response))
+                    if self.metrics:
+                        self.metrics.gauge(
+                            "queue.write_buffer", writer.transport.get_write_buffer_size()
+                        )
                     await writer.drain()
+                    if self.metrics:
+                        self.metrics.observe(f"command.{cmd}", time.perf_counter() - received)
                 if (
                     self._shutdown_event.is_set()
                     or self._exited_event.is_set()
@@ -466,14 +896,141 @@ class IPDBAdapterServer:
             # touching self.client_writer/self.client_reader here would
             # incorrectly disconnect the newer client instead.
             if self.client_writer is writer:
-                await self.disconnect_client()
+                try:
+                    await self.disconnect_client()
+                except asyncio.CancelledError:
+                    # Cancelled when the loop closes at exit. This task serves the
+                    # connection and nothing awaits it, while the stream server
+                    # reports a connection task that ends cancelled as an error.
+                    pass
+
+    def capture_output(self, output):
+        """
+        Start or stop forwarding the output of the program to the client, to be called in
+        the event loop thread. `output` is a bool, or a dict telling whether to forward
+        the log records of the root `logging` logger too, as in ``{"logging": True}``.
+        """
+        if not output:
+            self.output.stop()
+            return
+        self.output.start(logs=isinstance(output, dict) and output.get("logging", False))
+        if self._output_task is None or self._output_task.done():
+            loop = asyncio.get_running_loop()
+            event = asyncio.Event()
+            self.output.wakeup = lambda: loop.call_soon_threadsafe(event.set)
+            self._output_task = asyncio.create_task(self.forward_output(event))
+
+    async def forward_output(self, event):
+        """
+        Send the captured output every interval, or when `event` tells that enough of it
+        was buffered, until capturing stops.
+        """
+        while self.output:
+            try:
+                await asyncio.wait_for(event.wait(), self.output.interval)
+            except TimeoutError:
+                pass
+            event.clear()
+            await self.flush_output()
+
+    async def flush_output(self):
+        """
+        Send the buffered output, one event per category. Sending waits for the client to
+        read it, so a slow client makes the buffer fill up and the program drop output.
+        """
+        chunks, dropped = self.output.take()
+        if not self.client_connected:
+            return
+        for category, text in chunks:
+            await self.send_output(text, category)
+        if dropped:
+            # On a line of its own, the output was cut off anywhere
+            start = "\n" if chunks and not chunks[-1][1].endswith("\n") else ""
+            await self.send_output(
+                f"{start}[ipdab] {dropped} characters of output dropped\n", "important"
+            )
+
+    def set_profiling(self, profile):
+        """
+        Switch profiling between stops on or off.
+        `profile` is a bool, or the number of functions to report.
+        """
+        profiler = self.debugger.profiler
+        if isinstance(profile, bool):
+            profiler.enabled = profile
+        elif isinstance(profile, int):
+            profiler.enabled = profile > 0
+            profiler.top = profile
+        else:
+            raise ValueError(f"profile must be a bool or a number of functions, not {profile!r}")
+
+    def set_recording(self, record):
+        """
+        Switch recording the history of line events on or off. `record` is a bool, or a
+        dict with the maximum number of `events` and the `memoryLimit` in bytes.
+        """
+        history = self.debugger.history
+        if isinstance(record, dict):
+            history.configure(record.get("events"), record.get("memoryLimit"))
+            record = True
+        history.enabled = bool(record)
+
+    def complete(self, args):
+        """
+        The completions of the `completions` request with arguments `args`, in the
+        namespace of the requested frame at the current stop.
+        """
+        snapshot = self.debugger.snapshot
+        if snapshot is None:
+            return []
+        frame = snapshot.frame(args["frameId"]) if "frameId" in args else snapshot.top_frame
+        if frame is None:
+            return []
+        text = args.get("text", "")
+        if "line" in args:
+            lines = text.splitlines()
+            text = lines[args["line"] - 1] if 0 < args["line"] <= len(lines) else ""
+        base = 1 if self.client_capabilities.get("columnsStartAt1", True) else 0
+        # Only the reprs of the locals are recorded in the history, they have no attributes
+        live = not isinstance(frame, HistoryFrame)
+        shell = getattr(self.debugger.debugger, "shell", None)
+        index = snapshot.completions(
+            frame, attributes=live, shell=shell if live and self.ipython_completions else None
+        )
+        targets = index.complete(text, args.get("column", base) - base)
+        for target in targets:
+            target["start"] += base
+        return targets
+
+    def list_threads(self):
+        """
+        The live threads of the debuggee as DAP thread objects.
+
+        At a stop they come from the snapshot taken by the debugger, otherwise the
+        threads are enumerated on the spot. The adapter's own threads are left out.
+        With `async_tasks`, the first page of asyncio tasks is listed after the threads.
+        """
+        snapshot = self.debugger.snapshot
+        if snapshot is not None:
+            threads = snapshot.threads()
+            if self.async_tasks:
+                threads += snapshot.tasks(0, self.task_page_size)[0]
+        else:
+            threads = [(dap_thread_id(ident), name) for ident, name in live_threads()]
+        return [{"id": thread_id, "name": name} for thread_id, name in threads]
 
     async def disconnect_client(self):
         if self.client_connected:
-            self.client_writer.close()
-            await self.client_writer.wait_closed()
+            writer = self.client_writer
             self.client_writer = None
             self.client_reader = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                # E.g. a reset connection, which is gone either way. Cancellation, when the
+                # loop closes at exit, propagates to the cancelled task.
+                pass
 
     async def background_server(self):
         """
@@ -576,6 +1133,10 @@ class IPDBAdapterServer:
             # Only notify the client once, we set the shutdown event afterwards
             if self.client_connected:
                 await self.notify_terminated("shutdown")
+        self.output.stop()
+        if self._output_task is not None:
+            self._output_task.cancel()
+            self._output_task = None
         # Handle some edge cases
         if self.runner is not None:
             if self.server is None or self.server_task is None:
@@ -610,6 +1171,11 @@ class IPDBAdapterServer:
         in_thread = "in thread" if threading.current_thread() == self.thread else "in main thread"
         try:
             with asyncio.Runner() as runner:
+                # Named, so the threads of the executor are not listed as threads of the
+                # program, e.g. the one resolving the host to listen on
+                runner.get_loop().set_default_executor(
+                    concurrent.futures.ThreadPoolExecutor(thread_name_prefix=ADAPTER_THREAD_NAME)
+                )
                 self.runner = runner
                 runner.run(self.server_main())
         except Exception as e:
@@ -620,7 +1186,7 @@ class IPDBAdapterServer:
             self.runner = None
 
     def start_in_thread(self, max_wait_time=5):
-        self.thread = threading.Thread(target=self.run_loop, daemon=True)
+        self.thread = threading.Thread(target=self.run_loop, name=ADAPTER_THREAD_NAME, daemon=True)
         self.thread.start()
         t = time.time()
         dt = min(0.1, max_wait_time / 10)
@@ -644,30 +1210,179 @@ class IPDBAdapterServer:
                 f"[IPDB Server] DAP server did not start within {max_wait_time} seconds"
             )
 
-    def set_trace(self, frame=None, on_continue="exit_without_breakpoint"):
-        function_name = inspect.currentframe().f_code.co_name
-        in_thread = "in thread" if threading.current_thread() == self.thread else "in main thread"
-        self.on_continue = on_continue
+    def dump_threads(self):
+        """
+        Send the stacks of all threads to the client as output, without stopping.
+
+        Without a client, they are written to `sys.stderr` instead.
+        """
+        lines = []
+        for thread_id, name, stack in thread_stacks():
+            lines.append(f"Thread {thread_id} ({name}), most recent call first:\n")
+            for f, lineno in stack:
+                lines.append(
+                    f'  File "{f.f_code.co_filename}", line {lineno}, in {f.f_code.co_name}\n'
+                )
+        text = "".join(lines)
+        if self.server_running and self.client_connected:
+            asyncio.run_coroutine_threadsafe(self.send_output(text), self.runner._loop)
+        else:
+            sys.stderr.write(text)
+
+    def ensure_running(self):
+        """
+        Start the server in its thread, unless it is already running.
+        """
         if not self.server:
             self.start_in_thread()
             self._shutdown_event.clear()
             self._exited_event.clear()
             self._terminated_event.clear()
+
+    def post_mortem(self, tb, exception=None, on_continue="exit_without_breakpoint"):
+        """
+        Start the server if needed, and inspect traceback `tb` in the debugger.
+        """
+        if tb is None:
+            # E.g. an exception that was created, but never raised
+            raise ValueError("No traceback to inspect")
+        self.on_continue = on_continue
+        self.ensure_running()
+        try:
+            return self.debugger.post_mortem(tb, exception=exception)
+        except Exception as e:
+            function_name = inspect.currentframe().f_code.co_name
+            in_thread = (
+                "in thread" if threading.current_thread() == self.thread else "in main thread"
+            )
+            logging.error(
+                f"[IPDB Server {function_name} {in_thread}] Error of type {e.__class__.__name__} in post mortem: {e}"
+            )
+            raise
+
+    def run(self, target, module=False, wait=10):
+        """
+        Start the server, and run a script or module under the debugger, like
+        ``python -m ipdab``. The server keeps running until the program exits.
+
+        Parameters
+        ----------
+        target : str
+            The path of the script, or the name of the module if `module`.
+        module : bool
+            Run `target` as a module, like ``python -m``.
+        wait : float or None
+            Seconds to wait for a client to set its breakpoints and finish its
+            configuration before the program starts, None to wait for as long as it
+            takes, 0 to not wait at all. Breakpoints only arm the program if they are set
+            before it starts, as the thread of a program that starts without breakpoints
+            runs untraced, and can only be traced from within itself.
+        """
+        function_name = inspect.currentframe().f_code.co_name
+        in_thread = "in thread" if threading.current_thread() == self.thread else "in main thread"
+        self.on_continue = "keep_running"
+        self.ensure_running()
+        if wait != 0:
+            logging.info(
+                f"[IPDB Server {function_name} {in_thread}] Waiting for a client on {self.host}:{self.port}"
+            )
+            if not self.configured.wait(wait):
+                logging.warning(
+                    f"[IPDB Server {function_name} {in_thread}] No client configured within {wait} seconds, running without breakpoints"
+                )
+        return self.debugger.run(target, module=module)
+
+    def set_trace(
+        self,
+        frame=None,
+        on_continue="exit_without_breakpoint",
+        trace_threads=False,
+        async_tasks=False,
+    ):
+        self.on_continue = on_continue
+        # The tasks are listed, and asyncio skipped, for this call only
+        if async_tasks != self.async_tasks:
+            self.async_tasks = async_tasks
+            if async_tasks:
+                self.debugger.skip_modules(ASYNCIO_SKIP)
+            else:
+                self.debugger.unskip_modules(ASYNCIO_SKIP)
+            self.frames.clear()
+        self.ensure_running()
         # Enter ipdb prompt here
         try:
-            return self.debugger.set_trace(frame=frame)
+            return self.debugger.set_trace(frame=frame, trace_threads=trace_threads)
         except Exception as e:
+            # Only worked out on errors, this runs on every `set_trace`
+            function_name = inspect.currentframe().f_code.co_name
+            in_thread = (
+                "in thread" if threading.current_thread() == self.thread else "in main thread"
+            )
             logging.error(
                 f"[IPDB Server {function_name} {in_thread}] Error of type {e.__class__.__name__} while setting trace: {e}"
             )
             raise
 
 
+def function_breakpoint(bp):
+    """
+    Describe a function breakpoint of the debugger as DAP `Breakpoint`.
+    """
+    code = bp["code"]
+    if code is None:
+        return {"id": bp["id"], "verified": False, "message": bp["message"]}
+    return {
+        "id": bp["id"],
+        "verified": True,
+        "line": code.co_firstlineno,
+        "source": {"path": code.co_filename},
+    }
+
+
+def exception_details(exception, _seen=None):
+    """
+    Describe `exception` as DAP `ExceptionDetails`, including the exceptions it chains.
+
+    The inner exceptions are the explicit `__cause__`, or else the implicit `__context__`
+    unless it is suppressed, followed by the members of an exception group.
+    """
+    _seen = set() if _seen is None else _seen
+    _seen.add(id(exception))
+    exc_type = type(exception)
+    details = {
+        "message": str(exception),
+        "typeName": exc_type.__qualname__,
+        "fullTypeName": (
+            exc_type.__qualname__
+            if exc_type.__module__ == "builtins"
+            else f"{exc_type.__module__}.{exc_type.__qualname__}"
+        ),
+        "stackTrace": "".join(traceback.format_tb(exception.__traceback__)),
+    }
+    inner = []
+    chained = exception.__cause__
+    if chained is None and not exception.__suppress_context__:
+        chained = exception.__context__
+    if chained is not None:
+        inner.append(chained)
+    inner.extend(getattr(exception, "exceptions", None) or ())
+    inner = [
+        exception_details(exc, _seen)
+        for exc in inner
+        if isinstance(exc, BaseException) and id(exc) not in _seen
+    ]
+    if inner:
+        details["innerException"] = inner
+    return details
+
+
 # Create singleton adapter
 ipdab = IPDBAdapterServer()
+if os.environ.get("IPDAB_METRICS"):
+    ipdab.enable_metrics(os.environ["IPDAB_METRICS"])
 
 
-def set_trace(on_continue="keep_running"):
+def set_trace(on_continue="keep_running", trace_threads=False, async_tasks=False):
     """
     Entry point to set trace in the IPDB adapter server.
 
@@ -687,18 +1402,181 @@ def set_trace(on_continue="keep_running"):
         - "exit_without_breakpoint": Exit the debugger on continue if no further breakpoints are set. Note `set_trace` calls do not count as breakpoints, in such cases the debug server will be reinitialized, and the clients needs to reconnect.
         - "exit": Exit the debug server even if there are break points set.
         - "keep_running": Keep the debug server running after continue, allowing future `set_trace` calls to re-enter the debugger.
+    trace_threads : bool (default=False)
+        Also stop at breakpoints in threads started after this call, e.g., the workers
+        of a `ThreadPoolExecutor`. Threads that already run are listed and their stacks
+        can be inspected, but they cannot be stopped.
+    async_tasks : bool (default=False)
+        List the tasks of the running asyncio event loop as threads, each with its
+        suspended coroutine chain as stack, and step over the internals of `asyncio`.
+        Only the first `task_page_size` tasks are listed with the threads; the custom
+        `ipdab/tasks` request pages through the rest. Tasks are only enumerated when the
+        client asks for the threads. Later calls without `async_tasks` undo both.
     """
     frame = inspect.currentframe().f_back
-    retval = ipdab.set_trace(frame=frame, on_continue=on_continue)
+    retval = ipdab.set_trace(
+        frame=frame,
+        on_continue=on_continue,
+        trace_threads=trace_threads,
+        async_tasks=async_tasks,
+    )
     return retval
 
 
+def post_mortem(t=None, on_continue="keep_running"):
+    """
+    Inspect a traceback in the debugger, like `pdb.post_mortem`.
+
+    The debug server is only started when this is called, so it costs nothing until
+    then.
+
+    Parameters
+    ----------
+    t : traceback or BaseException, optional
+        The traceback, or the exception, to inspect. Defaults to the exception that is
+        currently being handled.
+    on_continue : str (default="keep_running")
+        Behavior when continuing, see `set_trace`.
+    """
+    if t is None:
+        exception = sys.exc_info()[1]
+        if exception is None:
+            raise ValueError("A valid traceback must be passed if no exception is being handled")
+        t = exception
+    if isinstance(t, BaseException):
+        exception, t = t, t.__traceback__
+    else:
+        exception = sys.exc_info()[1]
+        if exception is None or exception.__traceback__ is not t:
+            exception = None
+    return ipdab.post_mortem(t, exception=exception, on_continue=on_continue)
+
+
+def pm(on_continue="keep_running"):
+    """
+    Inspect the last uncaught exception in the debugger, like `pdb.pm`.
+    """
+    exception = getattr(sys, "last_value", None)
+    if exception is None:
+        raise ValueError("No last exception to inspect")
+    return post_mortem(exception, on_continue=on_continue)
+
+
+_excepthooks = {}
+
+
+def install_excepthook(threads=False):
+    """
+    Enter the debugger in post mortem mode whenever an exception is not caught.
+
+    The traceback is printed by the original hook first. Nothing is traced and the debug
+    server is not started until an exception actually goes uncaught.
+    `KeyboardInterrupt` is left alone.
+
+    Parameters
+    ----------
+    threads : bool (default=False)
+        Also debug exceptions that are not caught in threads, via `threading.excepthook`.
+    """
+    if "sys" not in _excepthooks:
+        previous = _excepthooks["sys"] = sys.excepthook
+
+        def excepthook(exc_type, exc_value, exc_traceback):
+            previous(exc_type, exc_value, exc_traceback)
+            if not issubclass(exc_type, KeyboardInterrupt):
+                post_mortem(exc_value)
+
+        sys.excepthook = excepthook
+    if threads and "threading" not in _excepthooks:
+        previous_threading = _excepthooks["threading"] = threading.excepthook
+
+        def threading_excepthook(args):
+            previous_threading(args)
+            if args.exc_value is not None and not issubclass(args.exc_type, KeyboardInterrupt):
+                post_mortem(args.exc_value)
+
+        threading.excepthook = threading_excepthook
+
+
+def uninstall_excepthook():
+    """
+    Restore the hooks replaced by `install_excepthook`.
+    """
+    if "sys" in _excepthooks:
+        sys.excepthook = _excepthooks.pop("sys")
+    if "threading" in _excepthooks:
+        threading.excepthook = _excepthooks.pop("threading")
+
+
+def enable_metrics(path=None):
+    """
+    Record latencies and counts of the adapter and the debugger, to find out what makes
+    stepping slow.
+
+    Recorded are the latency of each DAP command, bytes sent and received, the write
+    buffer of the connection, the time from a stop to the stopped event, the time to repr
+    each variable, the hit rate of the skip cache, and the number of trace callbacks.
+    Query them with the custom `ipdab/metrics` request. Metrics can also be switched on
+    with the environment variable `IPDAB_METRICS`, set to the path to dump them to.
+
+    Parameters
+    ----------
+    path : str, optional
+        Write the metrics to this file as JSON when the program exits.
+    """
+    ipdab.enable_metrics(path)
+
+
+def install_signal_handler(sig=None, on_continue="keep_running", dump_sig=None):
+    """
+    Attach the debugger when the process receives signal `sig`.
+
+    Until the signal arrives the process runs at full speed: there is no trace
+    function, no server thread and no open port. On the signal, the debug server is
+    started if it is not running yet, and the debugger stops in the frame of the main
+    thread that was interrupted, e.g., with ``kill -USR1 <pid>``.
+
+    Must be called from the main thread, as signal handlers always run there.
+
+    Parameters
+    ----------
+    sig : int, optional
+        The signal to attach on, defaults to `signal.SIGUSR1`.
+    on_continue : str (default="keep_running")
+        Behavior when continuing, see `set_trace`.
+    dump_sig : int, optional
+        A signal on which the stacks of all threads are sent to the client as output,
+        or written to stderr if no client is connected, without stopping the process.
+
+    Returns
+    -------
+    The previous handler of `sig`.
+    """
+    if sig is None:
+        sig = getattr(signal, "SIGUSR1", None)
+        if sig is None:
+            raise ValueError("SIGUSR1 is not available on this platform, pass a signal")
+
+    def handler(signum, frame):
+        ipdab.set_trace(frame=frame, on_continue=on_continue)
+
+    previous = signal.signal(sig, handler)
+    if dump_sig is not None:
+        signal.signal(dump_sig, lambda signum, frame: ipdab.dump_threads())
+    return previous
+
+
 def _at_exit_cleanup():
     """
     Cleanup logic, calls the ipdab.shutdown.
     Because the server runs in a daemon thread, this logical is called once the main thread exits.
     """
     ipdab.shutdown()
+    if ipdab.metrics and ipdab.metrics_path:
+        try:
+            ipdab.metrics.dump(ipdab.metrics_path)
+        except OSError as e:
+            logging.error(f"[IPDB Server] Could not write metrics to {ipdab.metrics_path}: {e}")
 
 
 atexit.register(_at_exit_cleanup)
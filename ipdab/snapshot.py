@@ -0,0 +1,306 @@
+import asyncio
+import itertools
+import sys
+import threading
+import time
+import weakref
+
+from .completions import CompletionIndex
+
+_thread_ids = {}
+_next_thread_id = itertools.count(2)
+_task_ids = weakref.WeakKeyDictionary()
+_tasks_by_id = weakref.WeakValueDictionary()
+
+#: The name of the adapter thread, and the prefix of the threads of its executor
+ADAPTER_THREAD_NAME = "ipdab-adapter"
+
+
+def _is_adapter_thread(name):
+    return name is not None and name.startswith(ADAPTER_THREAD_NAME)
+
+
+def dap_thread_id(ident):
+    """
+    Map a `threading` ident onto a small, stable DAP thread id.
+
+    Idents are pointer sized and some clients store ids in doubles, so they are not
+    sent as-is. The main thread is always 1, other threads are numbered in the order
+    in which the adapter first sees them.
+    """
+    if ident == threading.main_thread().ident:
+        return 1
+    try:
+        return _thread_ids[ident]
+    except KeyError:
+        return _thread_ids.setdefault(ident, next(_next_thread_id))
+
+
+def dap_task_id(task):
+    """
+    The DAP thread id under which an `asyncio.Task` is shown as a pseudo-thread.
+
+    Tasks share the id space of threads, and keep their id for as long as they live.
+    """
+    try:
+        return _task_ids[task]
+    except KeyError:
+        task_id = _task_ids.setdefault(task, next(_next_thread_id))
+        _tasks_by_id[task_id] = task
+        return task_id
+
+
+def coroutine_stack(task):
+    """
+    The suspended coroutine chain of `task` as `(frame, lineno)`, innermost frame first.
+
+    The chain is followed through `cr_await` (and `gi_yieldfrom` for generator based
+    coroutines) until it reaches something that is not a coroutine, usually the future
+    the task is waiting for.
+    """
+    stack = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append((frame, frame.f_lineno))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    stack.reverse()
+    return stack
+
+
+def live_threads():
+    """The `(ident, name)` pairs of the live threads of the program, not of the adapter."""
+    return [(t.ident, t.name) for t in threading.enumerate() if not _is_adapter_thread(t.name)]
+
+
+def thread_stacks():
+    """
+    The stacks of all live threads of the program, without stopping any of them.
+
+    Returns a list of `(thread_id, name, stack)` with `stack` a list of
+    `(frame, lineno)`, innermost frame first. The threads of the adapter are left out.
+    """
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = []
+    for ident, frame in sys._current_frames().items():
+        if _is_adapter_thread(names.get(ident)):
+            continue
+        stack = StopSnapshot._walk(frame)
+        stacks.append((dap_thread_id(ident), names.get(ident, f"Thread-{ident}"), stack))
+    return stacks
+
+
+class StopSnapshot:
+    """
+    The state of every thread at one stop of the debugger.
+
+    All threads are captured in a single pass when the debugger stops, with one call
+    to `sys._current_frames` and one to `threading.enumerate`, and the stack of every
+    thread, with the line of each frame, is walked right away, as the other threads run
+    on. Requests from the client are then served from the snapshot, rather than each of
+    them walking the interpreter state again. The threads of the adapter are left out.
+
+    The tasks of the event loop running in the stopping thread can be listed as
+    pseudo-threads. They are only enumerated when first asked for, and their coroutine
+    stacks only when the client asks for the stack of that particular task.
+
+    Frame ids and variable references handed out to the client index into tables held
+    by the snapshot, so they are only meaningful for the stop they were issued in. Once
+    the program runs again, the snapshot is released, after which it refers to no frames,
+    and ids and references issued at the stop resolve to nothing.
+
+    Parameters
+    ----------
+    frame : frame
+        The frame the debugger stopped in.
+    stack : list of (frame, int), optional
+        The stack of the stopping thread as kept by `bdb`, outermost frame first. It
+        carries the line numbers from the traceback in post mortem mode, which the
+        frames themselves do not. Without it, the stack is walked from `frame`.
+    ident : int, optional
+        The `threading` ident of the stopping thread, the current thread by default.
+    live : StopSnapshot, optional
+        The snapshot of the stop to take the threads, their stacks and the event loop
+        from, rather than capturing them, e.g., to show an event of the history from
+        the adapter thread. The stopping thread is that of `live` then.
+    """
+
+    def __init__(self, frame, stack=None, ident=None, live=None):
+        self.time = time.perf_counter()
+        if live is not None:
+            ident = live.ident
+        self.ident = threading.get_ident() if ident is None else ident
+        self.thread_id = dap_thread_id(self.ident)
+        self.top_frame = frame
+        # Results of the watch expressions, evaluated in `top_frame`
+        self.watches = None
+        # Report of the profiler since the last continue, if profiling
+        self.profile = None
+        # The modules added and removed since the previous stop
+        self.modules = ([], [])
+        if stack:
+            stack = [(f, lineno) for f, lineno in reversed(stack)]
+        else:
+            stack = self._walk(frame)
+        if live is None:
+            self._names = dict(live_threads())
+            self._stacks = {
+                dap_thread_id(ident): self._walk(top)
+                for ident, top in sys._current_frames().items()
+                if ident in self._names and ident != self.ident
+            }
+            self._loop = asyncio._get_running_loop()
+        else:
+            self._names = live._names
+            self._stacks = dict(live._stacks)
+            self._loop = live._loop
+        self._stacks[self.thread_id] = stack
+        self._tasks = None if live is None else live._tasks
+        self._frames = []
+        self._frame_ids = {}
+        self._handles = []
+        self._handle_ids = {}
+        # Completion indexes by frame, built when the client first asks for completions
+        self._completions = {}
+        # Objects with a buffer handed out as memory references, and their indexes by id
+        self._buffers = []
+        self._buffer_ids = {}
+        self.released = False
+
+    def release(self):
+        """Drop all references to frames, tasks and values captured at the stop."""
+        self.released = True
+        self.top_frame = None
+        self._stacks = {}
+        self._loop = None
+        self._tasks = None
+        self._frames = []
+        self._frame_ids = {}
+        self._handles = []
+        self._handle_ids = {}
+        self._completions = {}
+        self._buffers = []
+        self._buffer_ids = {}
+
+    @staticmethod
+    def _walk(frame):
+        stack = []
+        while frame is not None:
+            stack.append((frame, frame.f_lineno))
+            frame = frame.f_back
+        return stack
+
+    def threads(self):
+        """The `(thread_id, name)` pairs of all live threads of the program at the stop."""
+        return [(dap_thread_id(ident), name) for ident, name in self._names.items()]
+
+    def tasks(self, start=0, count=None):
+        """
+        A page of the tasks of the stopped event loop as `(thread_id, name)` pairs,
+        together with the total number of tasks.
+
+        The tasks are enumerated once per stop. Ids are only assigned to the tasks
+        on the requested page.
+        """
+        if self._tasks is None:
+            if self._loop is None:
+                self._tasks = []
+            else:
+                self._tasks = list(asyncio.all_tasks(self._loop))
+        stop = None if count is None else start + count
+        page = []
+        for task in self._tasks[start:stop]:
+            coro = getattr(task.get_coro(), "__qualname__", "?")
+            page.append((dap_task_id(task), f"Task {task.get_name()} ({coro})"))
+        return page, len(self._tasks)
+
+    def stack(self, thread_id):
+        """
+        The stack of a thread as `(frame_id, frame, lineno)`, innermost frame first.
+        For the pseudo-thread of a task, it is the task's coroutine stack.
+
+        Unknown threads, or threads that ended before the stop, have an empty stack, and
+        so do all threads once the snapshot is released.
+        """
+        return self.stack_page(thread_id)[0]
+
+    def stack_page(self, thread_id, start=0, count=None):
+        """
+        A page of `count` frames of the stack of a thread, from frame `start`, see
+        :meth:`stack`, together with the depth of the stack. Ids are only assigned to
+        the frames on the page.
+        """
+        if self.released:
+            return [], 0
+        try:
+            stack = self._stacks[thread_id]
+        except KeyError:
+            # A task, or a thread that was not alive at the stop
+            task = _tasks_by_id.get(thread_id)
+            stack = coroutine_stack(task) if task is not None else []
+            self._stacks[thread_id] = stack
+        stop = None if count is None else start + count
+        page = [(self._frame_id(frame), frame, lineno) for frame, lineno in stack[start:stop]]
+        return page, len(stack)
+
+    def _frame_id(self, frame):
+        try:
+            return self._frame_ids[id(frame)]
+        except KeyError:
+            self._frames.append(frame)
+            return self._frame_ids.setdefault(id(frame), len(self._frames) - 1)
+
+    def frame(self, frame_id):
+        """The frame with id `frame_id`, or None if it was not handed out at this stop."""
+        if 0 <= frame_id < len(self._frames):
+            return self._frames[frame_id]
+        return None
+
+    def memory_reference(self, value):
+        """Register the buffer of `value` and return a DAP memory reference for it."""
+        try:
+            index = self._buffer_ids[id(value)]
+        except KeyError:
+            self._buffers.append(value)
+            index = self._buffer_ids.setdefault(id(value), len(self._buffers) - 1)
+        return str(index)
+
+    def buffer(self, reference):
+        """The object registered under memory reference `reference`, or None."""
+        try:
+            index = int(reference)
+        except (TypeError, ValueError):
+            return None
+        if 0 <= index < len(self._buffers):
+            return self._buffers[index]
+        return None
+
+    def completions(self, frame, **kwargs):
+        """
+        The :class:`~ipdab.completions.CompletionIndex` of `frame`, which is built once
+        per stop, with `kwargs` passed on to it.
+        """
+        try:
+            return self._completions[id(frame)]
+        except KeyError:
+            return self._completions.setdefault(id(frame), CompletionIndex(frame, **kwargs))
+
+    def handle(self, value):
+        """
+        Register `value`, a hashable key like ``("locals", frame_id)``, and return a
+        variables reference for it, which is never 0. Equal keys get the same reference
+        for the whole stop, so expanding a scope again does not grow the table.
+        """
+        try:
+            return self._handle_ids[value]
+        except KeyError:
+            self._handles.append(value)
+            return self._handle_ids.setdefault(value, len(self._handles))
+
+    def resolve(self, reference):
+        """The value registered under variables reference `reference`, or None."""
+        if 0 < reference <= len(self._handles):
+            return self._handles[reference - 1]
+        return None
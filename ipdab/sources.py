@@ -0,0 +1,67 @@
+import linecache
+import threading
+
+
+class SourceRegistry:
+    """
+    Sources that only exist in memory, like the cells of IPython, served to the client
+    by `sourceReference`.
+
+    IPython puts the source of every cell in `linecache`, under the name the code of
+    the cell is compiled with, with no modification time since there is no file to
+    check it against. Those entries are what this registry hands out references for,
+    on first sight. Real files are left to the client to open by path.
+
+    The name a cell will get before it runs, so the client can set breakpoints in it,
+    comes from `code_name`, which the IPython extension sets, see
+    :func:`ipdab.extension.load_ipython_extension`.
+    """
+
+    def __init__(self):
+        self._references = {}
+        self._paths = []
+        # Called with the code of a cell, returns the name the cell is compiled with
+        self.code_name = None
+        self._lock = threading.Lock()
+
+    def reference(self, path):
+        """The `sourceReference` of `path`, 0 if the client can read it from disk."""
+        try:
+            return self._references[path]
+        except KeyError:
+            pass
+        entry = linecache.cache.get(path)
+        if entry is None or len(entry) != 4 or entry[1] is not None:
+            # Not known yet, lazily loaded, or a file
+            return 0
+        with self._lock:
+            if path not in self._references:
+                self._paths.append(path)
+                self._references[path] = len(self._paths)
+        return self._references[path]
+
+    def path(self, reference):
+        """The name of the source with `sourceReference` `reference`, or None."""
+        if isinstance(reference, int) and 0 < reference <= len(self._paths):
+            return self._paths[reference - 1]
+        return None
+
+    def source(self, reference):
+        """The text of the source with `sourceReference` `reference`, or None."""
+        path = self.path(reference)
+        entry = linecache.cache.get(path) if path is not None else None
+        if entry is None or len(entry) != 4:
+            return None
+        return "".join(entry[2])
+
+    def dump(self, code):
+        """
+        Register the source of a cell that has not run yet, as the Jupyter `dumpCell`
+        request does, and return the name it will be compiled with, or None if there
+        is no IPython extension to tell.
+        """
+        if self.code_name is None:
+            return None
+        name = self.code_name(code)
+        linecache.cache[name] = (len(code), None, code.splitlines(keepends=True), name)
+        return name
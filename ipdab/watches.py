@@ -0,0 +1,84 @@
+import reprlib
+
+
+def bounded_repr(maxstring=200, maxother=200):
+    """
+    A `reprlib.Repr` that keeps the repr of any value short, however large it is.
+    """
+    r = reprlib.Repr()
+    r.maxstring = maxstring
+    r.maxother = maxother
+    r.maxlist = r.maxtuple = r.maxset = r.maxfrozenset = r.maxdeque = r.maxarray = 20
+    r.maxdict = 10
+    return r
+
+
+class Watch:
+    """
+    A watch expression, compiled once when it is registered.
+    """
+
+    __slots__ = ("expression", "code", "error", "value")
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.value = None
+        try:
+            self.code = compile(expression, "<watch>", "eval")
+            self.error = None
+        except SyntaxError as e:
+            self.code = None
+            self.error = f"Error: {e}"
+
+
+class WatchRegistry:
+    """
+    Watch expressions evaluated by the debugger itself, once at every stop.
+
+    The client would otherwise have to send an `evaluate` request per watch after each
+    stopped event. Instead, the results are pushed together with the stop, and each
+    result tells whether its value changed since the previous stop, so the client can
+    highlight it without diffing.
+
+    Expressions are compiled when they are registered, and values are rendered with a
+    bounded repr, so evaluating the watches costs little even for huge values.
+    """
+
+    def __init__(self):
+        self._watches = []
+        self.repr = bounded_repr()
+
+    def __bool__(self):
+        return bool(self._watches)
+
+    def set(self, expressions):
+        """
+        Replace the watched expressions, keeping the last values of those that remain.
+
+        This may be called from another thread than the one evaluating the watches, the
+        new list is swapped in as a whole.
+        """
+        previous = {w.expression: w for w in self._watches}
+        self._watches = [previous.get(e) or Watch(e) for e in expressions]
+
+    def evaluate(self, frame):
+        """
+        Evaluate all watches in `frame`.
+
+        Returns a list of dicts with the `expression`, its `result` and whether it
+        `changed` since the last evaluation. A watch that is evaluated for the first
+        time has not changed.
+        """
+        results = []
+        for watch in self._watches:
+            if watch.code is None:
+                value = watch.error
+            else:
+                try:
+                    value = self.repr.repr(eval(watch.code, frame.f_globals, frame.f_locals))
+                except Exception as e:
+                    value = f"Error: {e}"
+            changed = watch.value is not None and watch.value != value
+            watch.value = value
+            results.append({"expression": watch.expression, "result": value, "changed": changed})
+        return results
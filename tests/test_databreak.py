@@ -0,0 +1,62 @@
+import types
+
+from ipdab.databreak import DataBreakpoint
+
+
+class Uncomparable:
+    """Like a NumPy array, whose `==` cannot be used as a bool."""
+
+    def __eq__(self, other):
+        raise ValueError("The truth value of an array is ambiguous")
+
+    __hash__ = object.__hash__
+
+
+class Broken:
+    @property
+    def value(self):
+        raise RuntimeError("broken property")
+
+
+def test_list_of_uncomparable_items():
+    items = [Uncomparable(), Uncomparable()]
+    bp = DataBreakpoint("global", "items", {"items": items}, "items")
+    assert not bp.changed()
+    items[0] = Uncomparable()
+    assert bp.changed()
+    assert not bp.changed()
+
+
+def test_dict_of_uncomparable_values():
+    values = {"a": Uncomparable()}
+    bp = DataBreakpoint("global", "values", {"values": values}, "values")
+    assert not bp.changed()
+    values["a"] = Uncomparable()
+    assert bp.changed()
+    assert not bp.changed()
+
+
+def test_rebound_uncomparable_scalar_subclass():
+    class Text(str):
+        def __eq__(self, other):
+            raise ValueError("cannot compare")
+
+        __hash__ = str.__hash__
+
+    namespace = {"text": "a"}
+    bp = DataBreakpoint("global", "text", namespace, "text")
+    namespace["text"] = Text("b")
+    assert bp.changed()
+
+
+def test_failing_property():
+    bp = DataBreakpoint("attribute", "value", Broken(), "obj.value")
+    assert not bp.changed()
+
+
+def test_attribute_change():
+    owner = types.SimpleNamespace(value=[1])
+    bp = DataBreakpoint("attribute", "value", owner, "owner.value")
+    owner.value.append(2)
+    assert bp.changed()
+    assert not bp.changed()
@@ -0,0 +1,41 @@
+import socket
+
+import pytest
+from IPython.core.interactiveshell import InteractiveShell
+
+from ipdab import server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def shell(monkeypatch):
+    # Created outside any shell, so with the ipdb backend, like when imported first
+    monkeypatch.setattr(server, "ipdab", server.IPDBAdapterServer(port=free_port()))
+    # ipdb created a terminal shell for itself, as there was none
+    InteractiveShell.clear_instance()
+    shell = InteractiveShell.instance()
+    yield shell
+    shell.run_line_magic("unload_ext", "ipdab")
+    server.ipdab.shutdown()
+    InteractiveShell.clear_instance()
+
+
+def test_load_under_non_terminal_shell(shell):
+    assert server.ipdab.debugger.backend == "ipdb"
+    shell.run_line_magic("load_ext", "ipdab")
+    assert server.ipdab.debugger.backend == "pdb"
+    assert server.ipdab.server_running
+    assert "ipdab" in shell.magics_manager.magics["line"]
+    result = shell.run_cell("x = 1 + 1")
+    assert result.success
+    assert shell.user_ns["x"] == 2
+
+
+def test_import_under_non_terminal_shell(shell):
+    debugger = server.Debugger(backend="ipdb")
+    assert debugger.backend == "pdb"